@@ -0,0 +1,111 @@
+# benchmarks/startup_importtime.py
+# -------------------------------------------------------------
+# Perfil de arranque basado en `python -X importtime`.
+# Comprueba que importar el servidor/core no arrastra LangChain,
+# Chroma ni proveedores LLM, y que cabe en el presupuesto de tiempo.
+#
+#   python benchmarks/startup_importtime.py
+#   python benchmarks/startup_importtime.py --module r4r_core.rag_chain --budget-ms 300
+#
+# Sale con código 1 si se supera el presupuesto o aparece un módulo prohibido.
+# -------------------------------------------------------------
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Paquetes que solo deben cargarse en el primer uso real
+HEAVY_PREFIXES = (
+    "langchain",
+    "langchain_core",
+    "langchain_ollama",
+    "langchain_openai",
+    "langchain_chroma",
+    "langchain_community",
+    "chromadb",
+    "numpy",
+)
+
+DEFAULT_MODULES = [
+    "r4r_ui.app",
+    "r4r_core.rag_chain",
+    "r4r_core.context_builder",
+    "r4r_core.summarizer_chain",
+    "r4r_core.vector_store",
+]
+
+
+def profile_import(module: str) -> tuple[float, list[tuple[int, int, str]]]:
+    """Importa ``module`` en un intérprete limpio con -X importtime.
+
+    Devuelve (segundos de pared, [(self_us, cumulative_us, nombre), ...]).
+    """
+    cmd = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1:] or ["?"]
+        raise RuntimeError(f"No se pudo importar {module}: {last[0]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, payload = line.split(":", 1)
+        self_us, cumulative_us, name = (part.strip() for part in payload.split("|", 2))
+        rows.append((int(self_us), int(cumulative_us), name))
+    return elapsed, rows
+
+
+def heavy_modules(rows: list[tuple[int, int, str]]) -> list[str]:
+    found = []
+    for _, _, name in rows:
+        top = name.strip().split(".")[0]
+        if top in HEAVY_PREFIXES:
+            found.append(name.strip())
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Perfil de arranque con -X importtime")
+    parser.add_argument("--module", action="append", help="módulo a perfilar (repetible)")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("R4R_STARTUP_BUDGET_MS", 1500)),
+        help="presupuesto de import acumulado por módulo (ms)",
+    )
+    parser.add_argument("--top", type=int, default=10, help="imports más lentos a mostrar")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or DEFAULT_MODULES:
+        try:
+            elapsed, rows = profile_import(module)
+        except RuntimeError as e:
+            print(f"[⚠️] {e} (¿dependencias sin instalar?)")
+            failed = True
+            continue
+
+        total_ms = sum(r[0] for r in rows) / 1000
+        heavy = heavy_modules(rows)
+        status = "✅" if total_ms <= args.budget_ms and not heavy else "❌"
+        print(f"{status} {module}: {total_ms:.1f} ms de import "
+              f"({elapsed * 1000:.0f} ms de proceso, presupuesto {args.budget_ms:.0f} ms)")
+        for self_us, cum_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[: args.top]:
+            print(f"     {cum_us / 1000:8.1f} ms  {name.strip()}")
+        if heavy:
+            print(f"   ❌ Dependencias pesadas importadas al arrancar: {', '.join(sorted(set(heavy))[:8])}")
+        failed |= status == "❌"
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
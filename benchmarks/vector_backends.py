@@ -0,0 +1,116 @@
+# benchmarks/vector_backends.py
+# -------------------------------------------------------------
+# Compara NumpyVectorBackend vs ChromaVectorBackend:
+# tiempo de indexado, latencia de consulta (p50/p95) y RSS pico.
+# Usa embeddings sintéticos deterministas (no necesita Ollama) y
+# ejecuta cada backend en un proceso aparte para aislar la RSS.
+#
+#   python benchmarks/vector_backends.py --docs 8 32 256 --dim 768
+# -------------------------------------------------------------
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class SyntheticEmbeddings:
+    """Embeddings pseudoaleatorios estables por texto (interfaz LangChain)."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _vec(self, text: str) -> list[float]:
+        import numpy as np
+
+        seed = sum(ord(c) * (i + 1) for i, c in enumerate(text)) % 2**32
+        return np.random.default_rng(seed).standard_normal(self.dim).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vec(text)
+
+
+def _rss_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / 1024**2
+
+
+def run_one(backend: str, n_docs: int, dim: int, queries: int) -> dict:
+    """Se ejecuta en el proceso hijo: indexa, consulta y mide."""
+    sys.path.insert(0, str(ROOT))
+    from langchain_core.documents import Document
+    from r4r_core.vector_store import ChromaVectorBackend, NumpyVectorBackend
+
+    rss_before = _rss_mb()
+    emb = SyntheticEmbeddings(dim)
+    docs = [
+        Document(page_content=f"context {i} " * 20, metadata={"phase": f"fase {i % 4}"})
+        for i in range(n_docs)
+    ]
+
+    start = time.perf_counter()
+    store = NumpyVectorBackend(emb) if backend == "numpy" else ChromaVectorBackend(emb)
+    store.add_documents(docs)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for q in range(queries):
+        t0 = time.perf_counter()
+        store.similarity_search(f"pregunta {q}", k=3)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    return {
+        "backend": backend,
+        "docs": n_docs,
+        "build_ms": round(build_ms, 2),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        "rss_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de backends vectoriales")
+    parser.add_argument("--docs", type=int, nargs="+", default=[8, 64, 512])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"])
+    parser.add_argument("--_child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        backend, n_docs = args._child
+        print(json.dumps(run_one(backend, int(n_docs), args.dim, args.queries)))
+        return 0
+
+    print(f"{'backend':8} {'docs':>6} {'build ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'ΔRSS MB':>8}")
+    for n_docs in args.docs:
+        for backend in args.backends:
+            cmd = [
+                sys.executable, __file__, "--_child", backend, str(n_docs),
+                "--dim", str(args.dim), "--queries", str(args.queries),
+            ]
+            proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+            lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+            if proc.returncode != 0 or not lines:
+                print(f"{backend:8} {n_docs:>6}  [⚠️] falló: {proc.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(lines[-1])
+            print(f"{r['backend']:8} {r['docs']:>6} {r['build_ms']:>10} "
+                  f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['rss_mb']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# r4r_core/analytics.py
+# -------------------------------------------------------------
+# Rollups incrementales de las métricas del HUD (ttf, tokens,
+# tok_per_s) por modelo, por proyecto y por hora.
+# Se actualizan en cada guardado de un mensaje assistant con
+# métricas, así /api/stats no necesita desempaquetar historiales.
+#
+# Percentiles aproximados con histogramas log‑espaciados
+# (buckets de ~9 %, error relativo ≲ 5 %), mergeables y baratos
+# de actualizar. Fichero SQLite compartido por todos los workers:
+#   PROJECTS_DIR/.r4r_stats.sqlite   (R4R_STATS_DB para moverlo)
+#
+#   python -m r4r_core.analytics --rebuild   (backfill desde los .pkl)
+# -------------------------------------------------------------
+
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+DIMENSIONS = ("model", "project", "hour")
+HIST_METRICS = ("ttf", "tok_per_s")
+BUCKET_BASE = 2 ** (1 / 8)
+ZERO_BUCKET = -10_000
+
+
+def bucket_of(value: float) -> int:
+    if value <= 0:
+        return ZERO_BUCKET
+    return math.floor(math.log(value, BUCKET_BASE))
+
+
+def bucket_value(bucket: int) -> float:
+    """Valor representativo (media geométrica) de un bucket."""
+    if bucket == ZERO_BUCKET:
+        return 0.0
+    return BUCKET_BASE ** (bucket + 0.5)
+
+
+def percentile(hist: list[tuple[int, int]], q: float) -> float | None:
+    """Percentil ``q`` (0‑1) de un histograma ``[(bucket, count), …]``."""
+    total = sum(c for _, c in hist)
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for bucket, count in sorted(hist):
+        seen += count
+        if seen > rank:
+            return round(bucket_value(bucket), 2)
+    return round(bucket_value(max(hist)[0]), 2)
+
+
+class MetricsRollup:
+    """Acumulados + histogramas por (dimensión, clave) en SQLite."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollup_totals ("
+            " dim TEXT, key TEXT, count INTEGER, sum_ttf REAL,"
+            " sum_tokens REAL, sum_tps REAL, PRIMARY KEY (dim, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollup_hist ("
+            " dim TEXT, key TEXT, metric TEXT, bucket INTEGER, count INTEGER,"
+            " PRIMARY KEY (dim, key, metric, bucket))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- escritura ----------
+    def record(self, project: str, model: str, metrics: dict, timestamp: str | None = None) -> None:
+        """Suma un mensaje a los rollups de modelo, proyecto y hora.
+
+        Sin ``timestamp`` (historiales antiguos) no se cuenta en la
+        dimensión ``hour``: imputarlo a la hora actual falsearía la serie.
+        """
+        ttf = float(metrics.get("ttf") or 0)
+        tokens = float(metrics.get("tokens") or 0)
+        tps = float(metrics.get("tok_per_s") or 0)
+        keys = {"model": model or "undefined", "project": project}
+        if timestamp:
+            keys["hour"] = datetime.fromisoformat(timestamp).strftime("%Y-%m-%dT%H:00")
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for dim, key in keys.items():
+                conn.execute(
+                    "INSERT INTO rollup_totals VALUES (?, ?, 1, ?, ?, ?)"
+                    " ON CONFLICT (dim, key) DO UPDATE SET count = count + 1,"
+                    " sum_ttf = sum_ttf + excluded.sum_ttf,"
+                    " sum_tokens = sum_tokens + excluded.sum_tokens,"
+                    " sum_tps = sum_tps + excluded.sum_tps",
+                    (dim, key, ttf, tokens, tps),
+                )
+                for metric in HIST_METRICS:
+                    value = ttf if metric == "ttf" else tps
+                    conn.execute(
+                        "INSERT INTO rollup_hist VALUES (?, ?, ?, ?, 1)"
+                        " ON CONFLICT (dim, key, metric, bucket) DO UPDATE SET count = count + 1",
+                        (dim, key, metric, bucket_of(value)),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def reset(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM rollup_totals")
+        conn.execute("DELETE FROM rollup_hist")
+
+    # ---------- lectura ----------
+    def summary(self, dim: str = "model", key: str | None = None) -> list[dict]:
+        if dim not in DIMENSIONS:
+            raise ValueError(f"Dimensión no soportada: {dim}")
+        conn = self._conn()
+        where, args = "dim = ?", [dim]
+        if key:
+            where, args = where + " AND key = ?", args + [key]
+
+        hists: dict[tuple[str, str], list[tuple[int, int]]] = {}
+        for k, metric, bucket, count in conn.execute(
+            f"SELECT key, metric, bucket, count FROM rollup_hist WHERE {where}", args
+        ):
+            hists.setdefault((k, metric), []).append((bucket, count))
+
+        rows = []
+        for k, count, sum_ttf, sum_tokens, sum_tps in conn.execute(
+            f"SELECT key, count, sum_ttf, sum_tokens, sum_tps FROM rollup_totals"
+            f" WHERE {where} ORDER BY key", args
+        ):
+            ttf_hist = hists.get((k, "ttf"), [])
+            tps_hist = hists.get((k, "tok_per_s"), [])
+            rows.append({
+                "key": k,
+                "count": count,
+                "ttf_avg": round(sum_ttf / count, 2),
+                "ttf_p50": percentile(ttf_hist, 0.50),
+                "ttf_p95": percentile(ttf_hist, 0.95),
+                "tok_per_s_avg": round(sum_tps / count, 2),
+                "tok_per_s_p50": percentile(tps_hist, 0.50),
+                "tok_per_s_p95": percentile(tps_hist, 0.95),
+                "tokens_avg": round(sum_tokens / count, 1),
+                "tokens_total": int(sum_tokens),
+            })
+        return rows
+
+
+_rollups: dict[Path, MetricsRollup] = {}
+_rollups_lock = threading.Lock()
+
+
+def get_rollup(projects_dir: Path) -> MetricsRollup:
+    """Rollup compartido del proceso para ``projects_dir``."""
+    db_path = Path(os.getenv("R4R_STATS_DB") or Path(projects_dir) / ".r4r_stats.sqlite")
+    with _rollups_lock:
+        if db_path not in _rollups:
+            _rollups[db_path] = MetricsRollup(db_path)
+        return _rollups[db_path]
+
+
+def record_message(project_dir: Path, entry: dict) -> bool:
+    """Hook de escritura: registra un mensaje assistant con métricas del HUD.
+
+    Se ignoran los ``ttf`` nulos (respuesta de creación de proyecto, que
+    no se mide) para no arrastrar los percentiles hacia cero.
+    """
+    meta = entry.get("meta") or {}
+    metrics = meta.get("metrics") or {}
+    if entry.get("role") != "assistant" or not metrics.get("ttf"):
+        return False
+    get_rollup(project_dir.parent).record(
+        project_dir.name, meta.get("model"), metrics, entry.get("timestamp")
+    )
+    return True
+
+
+def rebuild(projects_dir: Path) -> int:
+    """Recalcula los rollups desde cero leyendo todos los historiales (una vez)."""
+    from r4r_core.conversation_persistence import load_memory
+
+    rollup = get_rollup(projects_dir)
+    rollup.reset()
+    count = 0
+    for project_dir in sorted(p for p in projects_dir.iterdir() if p.is_dir()):
+        for phase_dir in sorted(p for p in project_dir.iterdir() if p.is_dir()):
+            memory_path = phase_dir / f"contextmemory_{phase_dir.name}.pkl"
+            for entry in load_memory(memory_path):
+                if isinstance(entry, dict) and record_message(project_dir, entry):
+                    count += 1
+    return count
+
+
+def main() -> None:
+    import argparse
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rollups de métricas R4R")
+    parser.add_argument("--rebuild", action="store_true", help="backfill desde los .pkl")
+    parser.add_argument("--by", default="model", choices=DIMENSIONS)
+    args = parser.parse_args()
+
+    projects_dir = Path(os.getenv("PROJECTS_DIR", "projects"))
+    if args.rebuild:
+        print(f"✅ {rebuild(projects_dir)} mensajes agregados")
+    for row in get_rollup(projects_dir).summary(args.by):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
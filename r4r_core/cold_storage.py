@@ -0,0 +1,287 @@
+# r4r_core/cold_storage.py
+# -------------------------------------------------------------
+# Almacenamiento por niveles: las fases "frías" (tienen context.md
+# y nadie las escribe desde hace N días) empaquetan su .pkl y todos
+# sus backups/*.bak en un único archivo comprimido:
+#
+#   <fase>/contextmemory_<fase>.r4ra
+#
+# Formato (acceso aleatorio, cada miembro en su propio bloque):
+#   MAGIC | miembro_1 | … | miembro_n | índice JSON | offset índice (8B)
+# El índice guarda offset, longitud, códec, tamaño, sha256 y mtime de
+# cada miembro. Los backups son casi copias del .pkl, así que se
+# comprimen contra él (campo ``ref``): el .pkl va como diccionario de
+# contenido crudo de zstd (o ``zdict`` de zlib si falta `zstandard`).
+# Leer cualquier miembro cuesta como mucho dos descompresiones.
+# Si el archivo no ocupa menos que los originales, no se archiva.
+#
+#   python -m r4r_core.cold_storage --days 30 [--dry-run]
+# -------------------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import lzma
+import os
+import pickle
+import struct
+import time
+import zlib
+from pathlib import Path
+
+MAGIC = b"R4RA1\n"
+ARCHIVE_SUFFIX = ".r4ra"
+
+
+def archive_path_for(memory_path: Path) -> Path:
+    return memory_path.with_suffix(ARCHIVE_SUFFIX)
+
+
+ZLIB_WINDOW = 32 * 1024  # zlib solo ve los últimos 32 KiB del diccionario
+
+
+def _zstd_dict(ref: bytes):
+    import zstandard
+
+    return zstandard.ZstdCompressionDict(ref, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def _compress(data: bytes, ref: bytes | None = None) -> tuple[str, bytes]:
+    """Comprime ``data``; con ``ref`` lo hace contra ese contenido (delta)."""
+    try:
+        import zstandard
+    except ImportError:
+        if ref is None:
+            return "xz", lzma.compress(data, preset=6)
+        # los backups comparten prefijo con el .pkl: ese prefijo es el zdict
+        comp = zlib.compressobj(9, zdict=ref[:ZLIB_WINDOW])
+        return "zlib", comp.compress(data) + comp.flush()
+    dict_data = _zstd_dict(ref) if ref is not None else None
+    return "zstd", zstandard.ZstdCompressor(level=10, dict_data=dict_data).compress(data)
+
+
+def _decompress(codec: str, data: bytes, ref: bytes | None = None) -> bytes:
+    if codec == "xz":
+        return lzma.decompress(data)
+    if codec == "zlib":
+        decomp = zlib.decompressobj(zdict=(ref or b"")[:ZLIB_WINDOW])
+        return decomp.decompress(data) + decomp.flush()
+    if codec == "zstd":
+        import zstandard
+
+        dict_data = _zstd_dict(ref) if ref is not None else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+    raise ValueError(f"Códec desconocido en archivo frío: {codec}")
+
+
+# ---------- lectura ----------
+def read_index(archive: Path) -> dict:
+    """Devuelve ``{nombre: entrada}`` leyendo solo el pie del archivo."""
+    with open(archive, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"No es un archivo R4R: {archive}")
+        f.seek(-8, os.SEEK_END)
+        (index_offset,) = struct.unpack("<Q", f.read(8))
+        f.seek(index_offset)
+        raw = f.read(os.fstat(f.fileno()).st_size - 8 - index_offset)
+    return json.loads(raw.decode("utf-8"))["members"]
+
+
+def read_member(
+    archive: Path, name: str, index: dict | None = None, cache: dict | None = None
+) -> bytes:
+    """Extrae un miembro (seek + lectura de su bloque) y verifica su hash.
+
+    Si el miembro es un delta (``ref``) se extrae antes su referencia;
+    ``cache`` permite reutilizarla al leer varios miembros seguidos.
+    """
+    index = index or read_index(archive)
+    entry = index[name]
+    if cache is not None and name in cache:
+        return cache[name]
+    ref = None
+    if entry.get("ref"):
+        ref = read_member(archive, entry["ref"], index, cache)
+    with open(archive, "rb") as f:
+        f.seek(entry["offset"])
+        data = _decompress(entry["codec"], f.read(entry["length"]), ref)
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError(f"Hash inválido para {name} en {archive.name}")
+    if cache is not None:
+        cache[name] = data
+    return data
+
+
+def load_archived_memory(memory_path: Path) -> list | None:
+    """Mensajes de una fase archivada, o None si no hay archivo frío."""
+    archive = archive_path_for(memory_path)
+    if not archive.exists():
+        return None
+    data = pickle.loads(read_member(archive, memory_path.name))
+    return data if isinstance(data, list) else []
+
+
+def archived_mtime(memory_path: Path) -> float:
+    """mtime original del .pkl archivado (0 si no hay archivo)."""
+    archive = archive_path_for(memory_path)
+    if not archive.exists():
+        return 0
+    entry = read_index(archive).get(memory_path.name)
+    return entry["mtime"] if entry else 0
+
+
+# ---------- escritura ----------
+def _phase_members(memory_path: Path) -> list[tuple[str, Path]]:
+    members = []
+    if memory_path.exists():
+        members.append((memory_path.name, memory_path))
+    backup_dir = memory_path.parent / "backups"
+    if backup_dir.exists():
+        for bak in sorted(backup_dir.glob(f"{memory_path.stem}_*.bak")):
+            members.append((f"backups/{bak.name}", bak))
+    return members
+
+
+def write_archive(
+    archive: Path, members: list[tuple[str, Path]], max_size: int | None = None
+) -> bool:
+    """Escribe el archivo de forma atómica (.tmp → replace).
+
+    El primer miembro (el .pkl) se comprime solo y sirve de referencia a
+    los demás. Con ``max_size``, si el resultado no es menor se descarta
+    y devuelve False.
+    """
+    tmp = archive.with_suffix(archive.suffix + ".tmp")
+    index = {}
+    ref_name, ref = None, None
+    with open(tmp, "wb") as out:
+        out.write(MAGIC)
+        for name, path in members:
+            data = path.read_bytes()
+            codec, blob = _compress(data, ref)
+            index[name] = {
+                "offset": out.tell(),
+                "length": len(blob),
+                "codec": codec,
+                "size": len(data),
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "mtime": path.stat().st_mtime,
+            }
+            if ref_name:
+                index[name]["ref"] = ref_name
+            else:
+                ref_name, ref = name, data
+            out.write(blob)
+        index_offset = out.tell()
+        out.write(json.dumps({"members": index}).encode("utf-8"))
+        out.write(struct.pack("<Q", index_offset))
+        out.flush()
+        os.fsync(out.fileno())
+    if max_size is not None and tmp.stat().st_size >= max_size:
+        tmp.unlink()
+        return False
+    tmp.replace(archive)
+    return True
+
+
+def is_cold(phase_dir: Path, days: float) -> bool:
+    """Fase con context.md y sin escrituras desde hace ``days`` días."""
+    if not (phase_dir / "context.md").exists():
+        return False
+    memory_path = phase_dir / f"contextmemory_{phase_dir.name}.pkl"
+    if not memory_path.exists():
+        return False  # vacía o ya archivada
+    newest = max(p.stat().st_mtime for _, p in _phase_members(memory_path))
+    return time.time() - newest >= days * 86400
+
+
+def archive_phase(phase_dir: Path) -> int:
+    """Empaqueta .pkl + backups de la fase y borra los originales.
+
+    Devuelve los bytes liberados (tamaño original − archivo); 0 si el
+    archivo no ocuparía menos y la fase se deja como estaba.
+    """
+    from r4r_core.conversation_persistence import phase_lock
+
+    memory_path = phase_dir / f"contextmemory_{phase_dir.name}.pkl"
+    with phase_lock(memory_path):
+        members = _phase_members(memory_path)
+        if not memory_path.exists() or not members:
+            return 0
+        archive = archive_path_for(memory_path)
+        if archive.exists():
+            # fase reactivada y vuelta a enfriar: conservar miembros antiguos
+            thaw_phase(memory_path)
+            members = _phase_members(memory_path)
+        original = sum(p.stat().st_size for _, p in members)
+        if not write_archive(archive, members, max_size=original):
+            print(f"[ℹ️] {phase_dir.name}: el archivo no ahorraría espacio; se deja sin archivar")
+            return 0
+
+        for _, path in members:
+            path.unlink()
+        backup_dir = phase_dir / "backups"
+        if backup_dir.exists() and not any(backup_dir.iterdir()):
+            backup_dir.rmdir()
+        return original - archive.stat().st_size
+
+
+def thaw_phase(memory_path: Path) -> bool:
+    """Restaura .pkl y backups desde el archivo frío y lo elimina.
+
+    Debe llamarse con ``phase_lock`` tomado (lo hace el escritor antes
+    de añadir un mensaje a una fase archivada).
+    """
+    archive = archive_path_for(memory_path)
+    if not archive.exists():
+        return False
+    index = read_index(archive)
+    cache: dict[str, bytes] = {}
+    for name, entry in index.items():
+        target = memory_path.parent / name
+        if target.exists():
+            continue  # nunca pisar una versión viva más reciente
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".thaw")
+        tmp.write_bytes(read_member(archive, name, index, cache))
+        os.utime(tmp, (entry["mtime"], entry["mtime"]))
+        tmp.replace(target)
+    archive.unlink()
+    print(f"[♨️] Fase descongelada: {memory_path.parent.name}")
+    return True
+
+
+def tier_projects(projects_dir: Path, days: float, dry_run: bool = False) -> dict:
+    """Recorre todos los proyectos y archiva las fases frías."""
+    stats = {"archived": 0, "bytes_saved": 0}
+    for project in sorted(p for p in projects_dir.iterdir() if p.is_dir()):
+        for phase_dir in sorted(p for p in project.iterdir() if p.is_dir()):
+            if not is_cold(phase_dir, days):
+                continue
+            print(f"🧊 {'(dry‑run) ' if dry_run else ''}Archivando {project.name}/{phase_dir.name}")
+            if dry_run:
+                stats["archived"] += 1
+                continue
+            saved = archive_phase(phase_dir)
+            if saved > 0:
+                stats["archived"] += 1
+                stats["bytes_saved"] += saved
+    return stats
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Archiva fases frías de R4R")
+    parser.add_argument("--days", type=float, default=float(os.getenv("R4R_COLD_AFTER_DAYS", 30)))
+    parser.add_argument("--projects-dir", default=os.getenv("PROJECTS_DIR", "projects"))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    stats = tier_projects(Path(args.projects_dir), args.days, args.dry_run)
+    print(f"✅ {stats['archived']} fases archivadas, {stats['bytes_saved'] / 1024:.1f} KiB liberados")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,11 +12,19 @@ from datetime import datetime
 from dotenv import load_dotenv
 import os
 from r4r_core.summarizer_chain import summarize_conversation
+from r4r_core.conversation_persistence import write_memory
+from r4r_core.cold_storage import load_archived_memory
 
 def load_existing_conversation(memory_path: Path) -> list[dict]:
-    """Carga un pickle existente de forma segura, con recuperación automática."""
+    """Carga un pickle existente de forma segura, con recuperación automática.
+
+    Las fases archivadas (``.r4ra``) se leen directamente del archivo frío.
+    """
     if not memory_path.exists():
-        raise FileNotFoundError(f"No existe: {memory_path}")
+        archived = load_archived_memory(memory_path)
+        if archived is None:
+            raise FileNotFoundError(f"No existe: {memory_path}")
+        return archived
 
     try:
         with open(memory_path, "rb") as f:
@@ -38,9 +46,8 @@ def load_existing_conversation(memory_path: Path) -> list[dict]:
                 try:
                     with open(last_backup, "rb") as bf:
                         data = pickle.load(bf)
-                        # reescribir copia estable
-                        with open(memory_path, "wb") as nf:
-                            pickle.dump(data, nf)
+                        # reescribir copia estable (bajo lock de fase)
+                        write_memory(memory_path, data)
                         return data
                 except Exception as ee:
                     print(f"[❌] No se pudo restaurar backup: {ee}")
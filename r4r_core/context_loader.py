@@ -5,9 +5,10 @@
 # -------------------------------------------------------------
 
 from pathlib import Path
-import pickle
 import yaml
 
+from r4r_core.conversation_persistence import load_memory
+
 
 class R4RContextLoader:
     def __init__(self, project_dir: Path):
@@ -20,10 +21,8 @@ class R4RContextLoader:
             return f.read()
 
     def _load_memory(self, memory_path: Path):
-        if not memory_path.exists():
-            return []
-        with open(memory_path, "rb") as f:
-            return pickle.load(f)
+        # load_memory cubre .pkl vivo, lock entre procesos y archivo frío (.r4ra)
+        return load_memory(memory_path)
 
     def _discover_phases(self) -> list[str]:
         """Devuelve lista ordenada de fases detectadas en el proyecto."""
@@ -3,30 +3,123 @@
 # Módulo de persistencia local de conversaciones R4R
 # Cada mensaje se guarda en disco (.pkl)
 # Autoguardado inmediato con backup seguro
+# Lectura‑modificación‑escritura protegida con lock entre procesos
 # -------------------------------------------------------------
 
+import os
 import pickle
 import shutil
 import time
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Iterator, List
+
+from r4r_core.analytics import record_message
+from r4r_core.cold_storage import archive_path_for, load_archived_memory, thaw_phase
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
 
 
 def ensure_dir(path: Path) -> None:
     """Crea el directorio padre si no existe."""
     path.parent.mkdir(parents=True, exist_ok=True)
 
-def append_message(memory_path: Path, role: str, content: str, extra: dict | None = None) -> None:
-    """Añade un mensaje (user o assistant) y guarda inmediatamente."""
+
+@contextmanager
+def phase_lock(memory_path: Path) -> Iterator[None]:
+    """Lock exclusivo entre procesos sobre la memoria de una fase.
+
+    Se bloquea un fichero hermano ``<pkl>.lock`` (el .pkl se reemplaza
+    atómicamente y no sirve como ancla). Bloqueante: espera al otro escritor.
+    """
     ensure_dir(memory_path)
-    messages: list[dict[str, Any]] = []
-    if memory_path.exists():
+    lock_path = memory_path.with_name(memory_path.name + ".lock")
+    with open(lock_path, "a+b") as fh:
+        if os.name == "nt":
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK reintenta ~10 s y luego lanza
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _read_unlocked(memory_path: Path) -> list[dict[str, Any]]:
+    if not memory_path.exists():
+        # fase fría: lectura directa del archivo comprimido (sin descongelar)
         try:
-            with open(memory_path, "rb") as f:
-                messages = pickle.load(f)
+            return load_archived_memory(memory_path) or []
         except Exception:
-            messages = []
+            return []
+    try:
+        with open(memory_path, "rb") as f:
+            data = pickle.load(f)
+            return data if isinstance(data, list) else []
+    except Exception:
+        return []
+
+
+def _write_unlocked(memory_path: Path, messages: list[dict[str, Any]]) -> None:
+    """Escritura atómica (.pkl.tmp → replace). Requiere ``phase_lock``."""
+    tmp_path = memory_path.with_suffix(".pkl.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(messages, f)
+    tmp_path.replace(memory_path)
+
+
+def memory_signature(memory_path: Path) -> tuple[int, int, int]:
+    """Huella barata (mtime, tamaño, inodo) para detectar escrituras ajenas.
+
+    El inodo cambia en cada ``replace`` atómico, así que dos escrituras dentro
+    del mismo tick de mtime siguen siendo distinguibles.
+    """
+    try:
+        st = memory_path.stat()
+    except FileNotFoundError:
+        return (0, 0, 0)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def write_memory(memory_path: Path, messages: list[dict[str, Any]]) -> None:
+    """Reemplaza la memoria completa de la fase bajo lock."""
+    with phase_lock(memory_path):
+        _write_unlocked(memory_path, messages)
+
+
+def append_message(
+    memory_path: Path, role: str, content: str, extra: dict | None = None
+) -> tuple[int, int, int]:
+    """Añade un mensaje (user o assistant) y guarda inmediatamente.
+
+    Devuelve la firma del .pkl tras escribir (ver ``memory_signature``).
+    """
+    with phase_lock(memory_path):
+        return _append_unlocked(memory_path, role, content, extra)[1]
+
+
+def _append_unlocked(
+    memory_path: Path, role: str, content: str, extra: dict | None
+) -> tuple[dict[str, Any], tuple[int, int, int]]:
+    """Devuelve la entrada escrita y la firma del .pkl resultante."""
+    # escribir en una fase archivada la devuelve al nivel "caliente"
+    thaw_phase(memory_path)
+    messages = _read_unlocked(memory_path)
 
     entry = {
         "timestamp": datetime.now().isoformat(timespec="seconds"),
@@ -40,36 +133,20 @@ def append_message(memory_path: Path, role: str, content: str, extra: dict | Non
 
     messages.append(entry)
 
-    tmp_path = memory_path.with_suffix(".pkl.tmp")
-    with open(tmp_path, "wb") as f:
-        pickle.dump(messages, f)
-    tmp_path.replace(memory_path)
-    auto_backup(memory_path)
-
-
     # 🟢 Guardamos atómicamente para evitar corrupción por cierres abruptos
-    tmp_path = memory_path.with_suffix(".pkl.tmp")
-    with open(tmp_path, "wb") as f:
-        pickle.dump(messages, f)
-
-    tmp_path.replace(memory_path)
+    _write_unlocked(memory_path, messages)
 
     # 🟢 Backup en cada guardado (copias versionadas)
     auto_backup(memory_path)
+    return entry, memory_signature(memory_path)
 
 
 def load_memory(memory_path: Path) -> List[dict[str, Any]]:
-    """Carga la conversación previa si existe."""
-    if not memory_path.exists():
-        return []
-    try:
-        with open(memory_path, "rb") as f:
-            data = pickle.load(f)
-            if not isinstance(data, list):
-                return []
-            return data
-    except Exception:
+    """Carga la conversación previa si existe (también desde archivo frío)."""
+    if not memory_path.exists() and not archive_path_for(memory_path).exists():
         return []
+    with phase_lock(memory_path):
+        return _read_unlocked(memory_path)
 
 
 def auto_backup(memory_path: Path) -> None:
@@ -88,16 +165,16 @@ def rollback_last(memory_path: Path) -> None:
     """Elimina el último mensaje en caso de fallo."""
     if not memory_path.exists():
         return
-    try:
-        with open(memory_path, "rb") as f:
-            messages = pickle.load(f)
-        if messages:
-            messages.pop()
-            with open(memory_path, "wb") as f:
-                pickle.dump(messages, f)
-    except Exception:
-        # no hacemos rollback si el archivo está corrupto
-        pass
+    with phase_lock(memory_path):
+        try:
+            with open(memory_path, "rb") as f:
+                messages = pickle.load(f)
+            if messages:
+                messages.pop()
+                _write_unlocked(memory_path, messages)
+        except Exception:
+            # no hacemos rollback si el archivo está corrupto
+            pass
 
 
 class SessionLogger:
@@ -108,16 +185,45 @@ class SessionLogger:
         self.phase = phase
         self.memory_path = self._build_path()
         ensure_dir(self.memory_path)
+        # firma del .pkl tras nuestra última lectura/escritura
+        self.synced_signature = (0, 0, 0)
 
     def _build_path(self) -> Path:
         folder = "main" if self.phase.lower() == "main" else self.phase
         return self.project_dir / folder / f"contextmemory_{folder}.pkl"
 
     def save(self, role: str, content: str, extra: dict | None = None) -> None:
-        append_message(self.memory_path, role, content, extra)
+        with phase_lock(self.memory_path):
+            # Solo avanzamos la firma si nadie escribió desde nuestra última sync;
+            # si no, is_stale() debe seguir avisando para rehidratar.
+            fresh = memory_signature(self.memory_path) == self.synced_signature
+            entry, signature = _append_unlocked(self.memory_path, role, content, extra)
+            if fresh:
+                self.synced_signature = signature
+        # rollups del HUD (/api/stats): nunca deben romper el guardado.
+        # Misma entrada que en el .pkl → misma hora que daría un --rebuild
+        try:
+            record_message(self.project_dir, entry)
+        except Exception as e:
+            print(f"[⚠️] No se pudieron actualizar las métricas agregadas: {e}")
 
     def load(self) -> List[dict[str, Any]]:
-        return load_memory(self.memory_path)
+        with phase_lock(self.memory_path):
+            self.synced_signature = memory_signature(self.memory_path)
+            return _read_unlocked(self.memory_path)
+
+    def is_stale(self) -> bool:
+        """True si otro proceso/sesión escribió el .pkl desde nuestra última sync."""
+        return memory_signature(self.memory_path) != self.synced_signature
+
+    def thaw(self) -> bool:
+        """Descongela la fase si está archivada (requiere ``locked()``)."""
+        return thaw_phase(self.memory_path)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        with phase_lock(self.memory_path):
+            yield
 
     def backup(self) -> None:
         auto_backup(self.memory_path)
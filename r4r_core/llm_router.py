@@ -0,0 +1,258 @@
+# r4r_core/llm_router.py
+# -------------------------------------------------------------
+# Router multi‑backend para Ollama:
+#   - lista de backends con peso (R4R_LLM_BACKENDS)
+#   - planificación least‑outstanding‑requests ponderada
+#   - límite de concurrencia por backend + cola con timeout
+#   - health checks periódicos (GET /api/tags) y failover
+# Expuesto como Runnable de LangChain → `prompt | llm | parser`.
+#
+#   R4R_LLM_BACKENDS=http://gpu1:11434|3,http://gpu2:11434|1
+# Sin R4R_LLM_BACKENDS se usa OLLAMA_API_HOST (un único backend).
+# -------------------------------------------------------------
+
+import json
+import os
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field
+
+
+@dataclass
+class LLMBackend:
+    url: str
+    weight: float = 1.0
+    max_concurrency: int = 2
+    outstanding: int = 0
+    healthy: bool = True
+    failures: int = 0
+    last_error: str = ""
+    _llm: object = field(default=None, repr=False)
+
+    def load(self) -> float:
+        """Carga relativa usada para elegir backend (menor = mejor)."""
+        return (self.outstanding + 1) / max(self.weight, 1e-6)
+
+
+def parse_backends(spec: str, max_concurrency: int) -> list[LLMBackend]:
+    """``"url|peso,url|peso"`` → lista de ``LLMBackend`` (peso opcional)."""
+    backends = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, weight = item.partition("|")
+        backends.append(LLMBackend(
+            url=url.strip().rstrip("/"),
+            weight=float(weight) if weight else 1.0,
+            max_concurrency=max_concurrency,
+        ))
+    return backends
+
+
+class LLMRouter:
+    """Reparte invocaciones entre varios servidores Ollama."""
+
+    def __init__(
+        self,
+        backends: list[LLMBackend],
+        model: str,
+        temperature: float = 0.3,
+        request_timeout: float = 300.0,
+        queue_timeout: float = 120.0,
+        health_path: str = "/api/tags",
+        health_timeout: float = 2.0,
+        num_ctx: int | None = None,
+    ):
+        if not backends:
+            raise ValueError("LLMRouter necesita al menos un backend")
+        self.backends = backends
+        self.model = model
+        self.temperature = temperature
+        self.request_timeout = request_timeout
+        self.queue_timeout = queue_timeout
+        self.health_path = health_path
+        self.health_timeout = health_timeout
+        # ventana explícita: coincide con el presupuesto de prompt_budget.py
+        self.num_ctx = num_ctx
+        self._cond = threading.Condition()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    # ---------- planificación ----------
+    def _pick(self, exclude: set[str]) -> LLMBackend | None:
+        candidates = [b for b in self.backends if b.url not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        # si todos parecen caídos se prueba igualmente (el health check puede ir tarde)
+        pool = healthy or candidates
+        free = [b for b in pool if b.outstanding < b.max_concurrency]
+        return min(free, key=LLMBackend.load) if free else None
+
+    def acquire(self, exclude: set[str] | None = None) -> LLMBackend:
+        """Reserva un hueco en el backend menos cargado; espera en cola si están llenos."""
+        exclude = exclude or set()
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            while True:
+                if all(b.url in exclude for b in self.backends):
+                    raise RuntimeError("No quedan backends LLM disponibles")
+                backend = self._pick(exclude)
+                if backend is not None:
+                    backend.outstanding += 1
+                    return backend
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Cola LLM saturada: ningún backend libre a tiempo")
+                self._cond.wait(remaining)
+
+    def release(self, backend: LLMBackend, error: Exception | None = None) -> None:
+        with self._cond:
+            backend.outstanding -= 1
+            if error is None:
+                # una respuesta correcta basta para volver a darlo por sano
+                # (p. ej. con health checks desactivados)
+                if not backend.healthy:
+                    print(f"[✅] Backend LLM recuperado: {backend.url}")
+                backend.failures = 0
+                backend.healthy = True
+            else:
+                backend.failures += 1
+                backend.healthy = False
+                backend.last_error = str(error)
+            self._cond.notify_all()
+
+    # ---------- ejecución ----------
+    def _client(self, backend: LLMBackend):
+        if backend._llm is None:
+            from langchain_ollama import ChatOllama
+
+            backend._llm = ChatOllama(
+                model=self.model,
+                temperature=self.temperature,
+                base_url=backend.url,
+                num_ctx=self.num_ctx,
+                client_kwargs={"timeout": self.request_timeout},
+            )
+        return backend._llm
+
+    def invoke(self, prompt, config=None):
+        """Invoca el modelo con failover: si un backend falla se prueba otro."""
+        tried: set[str] = set()
+        last_error: Exception | None = None
+        while len(tried) < len(self.backends):
+            try:
+                backend = self.acquire(exclude=tried)
+            except RuntimeError:
+                break
+            tried.add(backend.url)
+            try:
+                result = self._client(backend).invoke(prompt, config)
+            except Exception as e:
+                self.release(backend, e)
+                last_error = e
+                print(f"[⚠️] Backend LLM {backend.url} falló ({e}); failover…")
+                continue
+            self.release(backend)
+            return result
+        raise RuntimeError(f"Todos los backends LLM fallaron: {last_error}")
+
+    def as_runnable(self):
+        """Runnable de LangChain para encadenar ``prompt | router | parser``."""
+        from langchain_core.runnables import RunnableLambda
+
+        return RunnableLambda(self.invoke, name="R4RLLMRouter")
+
+    def preload(self, keep_alive: str = "10m") -> None:
+        """Carga el modelo en memoria de los backends sanos (POST /api/generate sin prompt)."""
+        body = json.dumps({"model": self.model, "keep_alive": keep_alive}).encode("utf-8")
+        for backend in [b for b in self.backends if b.healthy]:
+            req = urllib.request.Request(
+                backend.url + "/api/generate",
+                data=body,
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=self.request_timeout):
+                    pass
+            except Exception as e:
+                print(f"[⚠️] No se pudo precargar {self.model} en {backend.url}: {e}")
+
+    # ---------- salud ----------
+    def check_health(self) -> None:
+        for backend in self.backends:
+            try:
+                with urllib.request.urlopen(
+                    backend.url + self.health_path, timeout=self.health_timeout
+                ) as resp:
+                    ok = 200 <= resp.status < 300
+            except Exception as e:
+                ok = False
+                backend.last_error = str(e)
+            with self._cond:
+                if ok and not backend.healthy:
+                    print(f"[✅] Backend LLM recuperado: {backend.url}")
+                backend.healthy = ok
+                self._cond.notify_all()
+
+    def start_health_checks(self, interval: float) -> None:
+        if self._health_thread is not None or interval <= 0:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=loop, name="r4r-llm-health", daemon=True)
+        self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> list[dict]:
+        with self._cond:
+            return [
+                {
+                    "url": b.url,
+                    "weight": b.weight,
+                    "healthy": b.healthy,
+                    "outstanding": b.outstanding,
+                    "max_concurrency": b.max_concurrency,
+                    "last_error": b.last_error,
+                }
+                for b in self.backends
+            ]
+
+
+_router: LLMRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Router compartido del proceso, configurado desde .env."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            max_conc = int(os.getenv("R4R_LLM_MAX_CONCURRENCY", 2))
+            spec = os.getenv("R4R_LLM_BACKENDS") or os.getenv(
+                "OLLAMA_API_HOST", "http://localhost:11434"
+            )
+            _router = LLMRouter(
+                parse_backends(spec, max_conc),
+                model=os.getenv("MODEL_NAME", "mistral:7b"),
+                request_timeout=float(os.getenv("R4R_LLM_TIMEOUT", 300)),
+                queue_timeout=float(os.getenv("R4R_LLM_QUEUE_TIMEOUT", 120)),
+                num_ctx=int(os.getenv("R4R_CONTEXT_TOKENS", 4096)),
+            )
+            # también con un único backend: es lo que lo rehabilita tras un
+            # fallo puntual para preload() (que solo usa backends sanos)
+            _router.start_health_checks(float(os.getenv("R4R_LLM_HEALTH_INTERVAL", 15)))
+        return _router
+
+
+def routed_chat_model():
+    """Sustituto de ``ChatOllama(...)`` que pasa por el router."""
+    return get_router().as_runnable()
@@ -0,0 +1,201 @@
+# r4r_core/project_transfer.py
+# -------------------------------------------------------------
+# Exportación / importación de proyectos en streaming.
+# Formato: NDJSON comprimido con gzip, un registro por línea:
+#   {"type": "header", "format": "r4r-export/1", "project": …}
+#   {"type": "file", "path": "main/context.md", "size": …}
+#   {"type": "chunk", "data": "<base64 ≤ 64 KiB>"}       (×N)
+#   {"type": "file_end", "sha256": "…"}
+#   {"type": "footer", "files": N}
+# Ambos lados trabajan por trozos: la memoria no depende del tamaño
+# del historial. Los hashes se verifican al importar.
+# -------------------------------------------------------------
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import zlib
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Iterator
+
+FORMAT = "r4r-export/1"
+CHUNK_SIZE = 64 * 1024
+MAX_LINE = 1024 * 1024  # un registro nunca supera ~90 KiB; margen holgado
+SKIP_SUFFIXES = (".lock", ".tmp", ".thaw")
+
+
+def _export_files(project_dir: Path, include_backups: bool) -> Iterator[Path]:
+    for path in sorted(project_dir.rglob("*")):
+        if not path.is_file() or path.name.endswith(SKIP_SUFFIXES):
+            continue
+        if not include_backups and "backups" in path.relative_to(project_dir).parts:
+            continue
+        yield path
+
+
+def export_project(project_dir: Path, include_backups: bool = True) -> Iterator[bytes]:
+    """Genera el export comprimido trozo a trozo (apto para respuesta chunked).
+
+    Con ``include_backups=False`` se omiten las carpetas ``backups/``; los
+    archivos fríos ``.r4ra`` se exportan tal cual (ya incluyen sus backups).
+    """
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 → contenedor gzip
+
+    def emit(record: dict) -> bytes:
+        return gz.compress(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    yield emit({
+        "type": "header",
+        "format": FORMAT,
+        "project": project_dir.name,
+        "exported": datetime.now().isoformat(timespec="seconds"),
+        "backups": include_backups,
+    })
+
+    count = 0
+    for path in _export_files(project_dir, include_backups):
+        rel = path.relative_to(project_dir).as_posix()
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            continue  # reemplazado/archivado entre el listado y la apertura
+        digest = hashlib.sha256()
+        with f:
+            # tamaño del fichero abierto: un replace atómico posterior no lo cambia
+            yield emit({"type": "file", "path": rel, "size": os.fstat(f.fileno()).st_size})
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+                out = emit({"type": "chunk", "data": base64.b64encode(chunk).decode("ascii")})
+                if out:
+                    yield out
+        yield emit({"type": "file_end", "sha256": digest.hexdigest()})
+        count += 1
+
+    yield emit({"type": "footer", "files": count})
+    yield gz.flush()
+
+
+def _iter_records(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """Descomprime y separa líneas NDJSON de forma incremental."""
+    gz = zlib.decompressobj(31)
+    buffer = b""
+    try:
+        for chunk in chunks:
+            pending = chunk
+            while pending:
+                # max_length acota lo descomprimido por paso (memoria constante)
+                buffer += gz.decompress(pending, MAX_LINE)
+                pending = gz.unconsumed_tail
+                *lines, buffer = buffer.split(b"\n")
+                if len(buffer) > MAX_LINE:
+                    raise ValueError("Registro demasiado grande en el import")
+                for line in lines:
+                    if line.strip():
+                        yield _parse_record(line)
+        buffer += gz.flush()
+    except zlib.error as e:
+        raise ValueError(f"El import no es un gzip válido: {e}") from e
+    if buffer.strip():
+        yield _parse_record(buffer)
+
+
+def _parse_record(line: bytes) -> dict:
+    record = json.loads(line)  # JSONDecodeError ya es un ValueError
+    if not isinstance(record, dict):
+        raise ValueError("Registro NDJSON no es un objeto")
+    return record
+
+
+def _field(record: dict, key: str, kind: type):
+    """Campo obligatorio de un registro, con el tipo esperado."""
+    value = record.get(key)
+    if not isinstance(value, kind):
+        raise ValueError(f"Registro '{record.get('type')}' sin campo '{key}' válido")
+    return value
+
+
+def _safe_target(root: Path, rel: str) -> Path:
+    parts = PurePosixPath(rel).parts
+    if not parts or PurePosixPath(rel).is_absolute() or ".." in parts:
+        raise ValueError(f"Ruta no permitida en el import: {rel}")
+    return root.joinpath(*parts)
+
+
+def import_project(chunks: Iterable[bytes], projects_dir: Path) -> dict:
+    """Reconstruye un proyecto desde un export en streaming.
+
+    Escribe en un directorio temporal y solo lo publica (rename) cuando
+    el pie y todos los hashes cuadran. Si el slug ya existe se añade un
+    sufijo ``_import_<id>``. Devuelve ``{"project", "files", "bytes"}``.
+    """
+    staging = projects_dir / f"tmp_import_{uuid.uuid4().hex[:8]}"
+    staging.mkdir(parents=True)
+    current = None  # (fichero abierto, sha256, ruta, tamaño esperado)
+    try:
+        header = None
+        files = total = 0
+        footer = None
+
+        for record in _iter_records(chunks):
+            kind = record.get("type")
+            if header is None:
+                if kind != "header" or record.get("format") != FORMAT:
+                    raise ValueError("Export no reconocido (falta cabecera r4r-export/1)")
+                header = record
+            elif kind == "file":
+                if current:
+                    raise ValueError("Fichero sin cerrar en el export")
+                rel = _field(record, "path", str)
+                target = _safe_target(staging, rel)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                current = (open(target, "wb"), hashlib.sha256(), rel, record.get("size"))
+            elif kind == "chunk":
+                if not current:
+                    raise ValueError("Datos fuera de fichero en el export")
+                # binascii.Error (base64 corrupto) es un ValueError
+                data = base64.b64decode(_field(record, "data", str), validate=True)
+                current[0].write(data)
+                current[1].update(data)
+                total += len(data)
+            elif kind == "file_end":
+                if not current:
+                    raise ValueError("file_end sin fichero abierto")
+                fh, digest, rel, size = current
+                fh.close()
+                current = None
+                if digest.hexdigest() != record.get("sha256"):
+                    raise ValueError(f"Hash incorrecto para {rel}")
+                if size is not None and _safe_target(staging, rel).stat().st_size != size:
+                    raise ValueError(f"Tamaño incorrecto para {rel}")
+                files += 1
+            elif kind == "footer":
+                if current:
+                    raise ValueError("Fichero sin cerrar en el export")
+                footer = record
+                break
+
+        if current:
+            raise ValueError("Fichero sin cerrar en el export")
+        if header is None or footer is None:
+            raise ValueError("Export truncado (sin cabecera o pie)")
+        if footer.get("files") != files:
+            raise ValueError(f"Se esperaban {footer.get('files')} ficheros, llegaron {files}")
+
+        project = _field(header, "project", str)
+        slug = PurePosixPath(project).name
+        if not slug or slug.startswith("."):
+            raise ValueError(f"Nombre de proyecto inválido: {project}")
+        final = projects_dir / slug
+        if final.exists():
+            final = projects_dir / f"{slug}_import_{uuid.uuid4().hex[:8]}"
+        staging.rename(final)
+        return {"project": final.name, "files": files, "bytes": total}
+    except Exception:
+        if current:
+            current[0].close()
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
@@ -0,0 +1,307 @@
+# r4r_core/prompt_budget.py
+# -------------------------------------------------------------
+# Empaquetado del prompt por presupuesto de tokens:
+#   1. trocea los context.md recuperados en pasajes (párrafos)
+#   2. descarta pasajes casi idénticos entre sí o a turnos de la
+#      conversación (shingles de palabras + MinHash)
+#   3. llena el presupuesto por relevancia: conversación reciente
+#      primero (hasta su cuota) y luego contexto por puntuación
+# Los tokens se cuentan con un tokenizer real (R4R_TOKENIZER):
+#   hf:<tokenizer.json | repo>  → `tokenizers` (p. ej. el de Mistral)
+#   tiktoken:<encoding>         → `tiktoken`
+#   approx                      → heurística (sin dependencias)
+#   auto (defecto)              → tokenizer del modelo servido (MODEL_NAME,
+#                                 ver SERVED_TOKENIZERS) si está en la caché
+#                                 local de HF; si no, avisa y aproxima con
+#                                 tiktoken:cl100k_base (si está en caché) /
+#                                 approx. Nunca descarga nada.
+# Con recuento aproximado el presupuesto se recorta un margen
+# (R4R_APPROX_TOKEN_MARGIN) para no desbordar num_ctx.
+# -------------------------------------------------------------
+
+import hashlib
+import os
+import tempfile
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_ROLE_RE = re.compile(r"^\s*(user|assistant|human|ai)\s*:\s*", re.IGNORECASE)
+
+
+# ---------- tokenizer ----------
+# familia de modelo Ollama (MODEL_NAME sin tag) → repo HF con su tokenizer.
+# Repos con acceso restringido necesitan HF_TOKEN o un tokenizer.json local.
+SERVED_TOKENIZERS = {
+    "mistral": "mistralai/Mistral-7B-Instruct-v0.3",
+    "qwen2.5": "Qwen/Qwen2.5-7B-Instruct",
+}
+
+
+def served_tokenizer_repo(model: str | None = None) -> str | None:
+    """Repo HF del tokenizer del modelo servido, o None si no se conoce."""
+    model = model or os.getenv("MODEL_NAME", "mistral:7b")
+    return SERVED_TOKENIZERS.get(model.split(":")[0].split("/")[-1].lower())
+
+
+def _cached_tokenizer(repo: str) -> str | None:
+    """Ruta de ``tokenizer.json`` en la caché local de HF (sin red)."""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return None
+    path = try_to_load_from_cache(repo, "tokenizer.json")
+    return path if isinstance(path, str) else None
+
+
+_TIKTOKEN_BLOBS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+}
+
+
+def _tiktoken_cached(encoding: str) -> bool:
+    """True si ``tiktoken`` tiene la codificación en su caché (misma ruta que
+    ``tiktoken.load.read_file_cached``), es decir, si cargarla no va a la red."""
+    blob = _TIKTOKEN_BLOBS.get(encoding)
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR", os.environ.get(
+        "DATA_GYM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    ))
+    if not blob or not cache_dir:
+        return False
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(blob.encode()).hexdigest()))
+
+
+class TokenCounter:
+    """Cuenta tokens con el tokenizer configurado (cae a aproximación si falla)."""
+
+    def __init__(self, spec: str | None = None):
+        spec = spec or os.getenv("R4R_TOKENIZER", "auto")
+        self.name, self._encode = self._resolve(spec)
+        # cualquier cosa que no sea el tokenizer del modelo servido (o uno
+        # elegido explícitamente) es una estimación
+        self.approximate = self.name == "approx" or self.name.endswith("~approx")
+
+    @classmethod
+    def _resolve(cls, spec: str):
+        if spec != "auto":
+            loaded = cls._load(spec)
+            if loaded:
+                return loaded
+            print("[⚠️] Usando aproximación de tokens (~1.3 por palabra).")
+            return cls._approx()
+
+        # solo la caché local: una descarga aquí bloquearía la primera consulta
+        model = os.getenv("MODEL_NAME", "mistral:7b")
+        repo = served_tokenizer_repo(model)
+        cached = _cached_tokenizer(repo) if repo else None
+        loaded = cls._load(f"hf:{cached}") if cached else None
+        if loaded:
+            return f"hf:{repo}", loaded[1]
+
+        # sin el tokenizer del modelo servido cualquier recuento es aproximado
+        hint = f"R4R_TOKENIZER=hf:{repo} (descarga)" if repo else "R4R_TOKENIZER=hf:<repo>"
+        hint += " o hf:/ruta/tokenizer.json"
+        loaded = cls._load("tiktoken:cl100k_base") if _tiktoken_cached("cl100k_base") else None
+        if loaded:
+            print(f"[⚠️] Tokenizer de {model} no disponible: aproximando con cl100k_base ({hint}).")
+            return f"{loaded[0]}~approx", loaded[1]
+        print(f"[⚠️] Tokenizer de {model} no disponible: aproximando ~1.3 tokens por palabra ({hint}).")
+        return cls._approx()
+
+    @staticmethod
+    def _load(spec: str):
+        kind, _, arg = spec.partition(":")
+        try:
+            if kind == "hf":
+                from tokenizers import Tokenizer
+
+                tok = Tokenizer.from_file(arg) if Path(arg).is_file() else Tokenizer.from_pretrained(arg)
+                return f"hf:{arg}", lambda t: len(tok.encode(t, add_special_tokens=False).ids)
+            if kind == "tiktoken":
+                import tiktoken
+
+                enc = tiktoken.get_encoding(arg or "cl100k_base")
+                return f"tiktoken:{enc.name}", lambda t: len(enc.encode(t, disallowed_special=()))
+            if kind == "approx":
+                return TokenCounter._approx()
+            raise ValueError(f"tipo de tokenizer desconocido: {kind}")
+        except Exception as e:
+            print(f"[⚠️] Tokenizer {spec} no disponible ({e}).")
+            return None
+
+    @staticmethod
+    def _approx():
+        # ~1.3 tokens BPE por palabra/puntuación en español: sobreestima a propósito
+        return "approx", lambda t: int(len(_WORD_RE.findall(t)) * 1.3) + 1
+
+    def count(self, text: str) -> int:
+        return self._encode(text) if text else 0
+
+
+@lru_cache(maxsize=4)
+def get_token_counter(spec: str | None = None) -> TokenCounter:
+    return TokenCounter(spec)
+
+
+# ---------- deduplicación ----------
+_MERSENNE = (1 << 31) - 1
+
+
+@lru_cache(maxsize=1)
+def _perm_params(num_perm: int):
+    import numpy as np
+
+    rng = np.random.default_rng(0x5EED)
+    a = rng.integers(1, _MERSENNE, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def normalize(text: str) -> list[str]:
+    """Palabras en minúscula sin prefijo de rol (USER:/human: …)."""
+    return [w.lower() for w in _WORD_RE.findall(_ROLE_RE.sub("", text)) if w.isalnum()]
+
+
+def shingles(text: str, k: int = 5) -> set[int]:
+    """Hashes de 32 bits de los k‑shingles de palabras."""
+    words = normalize(text)
+    k = max(1, min(k, len(words)))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + k]).encode(), digest_size=4).digest(), "little")
+        for i in range(max(1, len(words) - k + 1))
+    } if words else set()
+
+
+def minhash(shingle_set: set[int], num_perm: int = 64):
+    """Firma MinHash vectorizada: (a·h + b) mod (2³¹−1), mínimo por permutación."""
+    import numpy as np
+
+    if not shingle_set:
+        return None
+    a, b = _perm_params(num_perm)
+    h = np.fromiter(shingle_set, dtype=np.uint64)
+    return ((np.outer(a, h) + b[:, None]) % _MERSENNE).min(axis=1)
+
+
+def similarity(sig_a, sig_b) -> float:
+    """Jaccard estimada entre dos firmas MinHash."""
+    if sig_a is None or sig_b is None:
+        return 0.0
+    return float((sig_a == sig_b).mean())
+
+
+# ---------- empaquetado ----------
+@dataclass
+class PackedPrompt:
+    context: str
+    conversation: str
+    stats: dict = field(default_factory=dict)
+
+
+class PromptPacker:
+    """Rellena contexto + conversación dentro de un presupuesto de tokens.
+
+    ``budget`` es lo que queda para ambos bloques tras descontar plantilla,
+    pregunta y reserva de respuesta (ver ``available_budget``).
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter | None = None,
+        history_share: float | None = None,
+        dedup_threshold: float | None = None,
+        num_perm: int = 64,
+    ):
+        self.counter = counter or get_token_counter()
+        self.history_share = history_share if history_share is not None else float(
+            os.getenv("R4R_HISTORY_SHARE", 0.5)
+        )
+        self.dedup_threshold = dedup_threshold if dedup_threshold is not None else float(
+            os.getenv("R4R_DEDUP_THRESHOLD", 0.8)
+        )
+        self.num_perm = num_perm
+
+    def available_budget(self, template: str, question: str) -> int:
+        """Ventana de contexto − reserva de respuesta − plantilla − pregunta.
+
+        Si el recuento es aproximado, la parte del prompt se reduce en
+        ``R4R_APPROX_TOKEN_MARGIN`` (el tokenizer real del modelo puede
+        dar más tokens por palabra que la estimación).
+        """
+        window = int(os.getenv("R4R_CONTEXT_TOKENS", 4096))
+        reserve = int(os.getenv("R4R_RESPONSE_TOKENS", 512))
+        fixed = self.counter.count(template) + self.counter.count(question)
+        prompt_window = window - reserve
+        if self.counter.approximate:
+            margin = float(os.getenv("R4R_APPROX_TOKEN_MARGIN", 0.2))
+            prompt_window = int(prompt_window * (1 - margin))
+        return max(0, prompt_window - fixed)
+
+    @staticmethod
+    def split_passages(text: str) -> list[str]:
+        """Párrafos del cuerpo (sin el bloque YAML, que va aparte)."""
+        body = text
+        meta = ""
+        if text.startswith("---"):
+            parts = text.split("---", 2)
+            if len(parts) == 3:
+                meta, body = parts[1].strip(), parts[2]
+        passages = [p.strip() for p in re.split(r"\n\s*\n", body) if p.strip()]
+        return ([meta] if meta else []) + passages
+
+    def pack(self, docs: list, history: list[tuple[str, str]], question: str, budget: int) -> PackedPrompt:
+        """``docs``: documentos recuperados (orden de relevancia);
+        ``history``: ``[(rol, texto), …]`` del más antiguo al más reciente,
+        sin la pregunta actual.
+        """
+        stats = {"budget": budget, "duplicates": 0, "dropped_context": 0, "dropped_history": 0}
+        q_words = set(normalize(question))
+
+        # 1️⃣ conversación reciente hasta su cuota
+        history_budget = int(budget * self.history_share)
+        kept_history: list[str] = []
+        used = 0
+        for i, (role, content) in enumerate(reversed(history)):
+            line = f"{role}: {content}"
+            cost = self.counter.count(line) + 1
+            if used + cost > history_budget:
+                stats["dropped_history"] = len(history) - i
+                break
+            kept_history.append(line)
+            used += cost
+        kept_history.reverse()
+        seen = [minhash(shingles(line), self.num_perm) for line in kept_history]
+
+        # 2️⃣ pasajes candidatos con puntuación de relevancia
+        candidates = []
+        for rank, doc in enumerate(docs):
+            for pos, passage in enumerate(self.split_passages(doc.page_content)):
+                words = set(normalize(passage))
+                overlap = len(words & q_words) / max(1, len(q_words))
+                score = 1.0 / (1 + rank) + overlap - 0.001 * pos
+                candidates.append((score, passage))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        # 3️⃣ dedup (contra conversación y entre sí) + llenado por relevancia
+        kept_context: list[str] = []
+        context_budget = budget - used
+        context_used = 0
+        for score, passage in candidates:
+            sig = minhash(shingles(passage), self.num_perm)
+            if any(similarity(sig, other) >= self.dedup_threshold for other in seen):
+                stats["duplicates"] += 1
+                continue
+            cost = self.counter.count(passage) + 2
+            if context_used + cost > context_budget:
+                stats["dropped_context"] += 1
+                continue
+            kept_context.append(passage)
+            context_used += cost
+            seen.append(sig)
+
+        stats["context_tokens"] = context_used
+        stats["history_tokens"] = used
+        stats["tokenizer"] = self.counter.name
+        return PackedPrompt("\n\n".join(kept_context), "\n".join(kept_history), stats)
@@ -6,12 +6,9 @@
 
 from pathlib import Path
 from r4r_core.vector_store import R4RVectorStore
-from r4r_core.conversation_persistence import SessionLogger
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain.memory import ConversationBufferMemory
+from r4r_core.conversation_persistence import SessionLogger, memory_signature
+from r4r_core.llm_router import routed_chat_model
+from r4r_core.prompt_budget import PromptPacker
 from dotenv import load_dotenv
 import os
 
@@ -24,59 +21,86 @@ class R4RConversationalRAG:
     """
 
     def __init__(self, project_dir: Path, phase: str):
+        # dependencias pesadas: se cargan al construir la primera sesión
+        from langchain.memory import ConversationBufferMemory
+
         load_dotenv()
         self.project_dir = project_dir
         self.phase = phase
 
-        # Modelo LLM desde .env
-        self.llm = ChatOllama(
-            model=os.getenv("MODEL_NAME", "mistral:7b"),
-            temperature=0.3,
-            base_url=os.getenv("OLLAMA_API_HOST", "http://localhost:11434"),
-        )
+        # Modelo LLM desde .env (router multi‑backend, ver llm_router.py)
+        self.llm = routed_chat_model()
 
         # Core components
         self.memory = ConversationBufferMemory(return_messages=True)
         self.vector_store = R4RVectorStore()
         self.logger = SessionLogger(project_dir, phase)
+        self.packer = PromptPacker()
 
     # ────────────────────────────────────────────
     #   INIT / HYDRATION
     # ────────────────────────────────────────────
-    def initialize(self):
+    def initialize(self, cancelled=None) -> bool:
         """Indexa contextos (main + fases) en memoria
         y reconstruye el buffer RAM desde el .pkl existente.
+
+        ``cancelled`` (threading.Event) permite abandonar el indexado entre
+        lotes; devuelve False si se canceló antes de terminar.
         """
         print(f"🧩 Indexando contextos de {self.project_dir.name} ...")
-        self.vector_store.index_contexts(self.project_dir)
+        stats = self.vector_store.index_contexts(self.project_dir, cancelled=cancelled)
+        if stats.get("cancelled"):
+            return False
 
         # Rehidratar .pkl → contextMemory (RAM)
         previous_msgs = self.logger.load()
         if previous_msgs:
-            for m in previous_msgs:
-                role = m["role"].lower()
-                content = m["content"]
-                if role == "user":
-                    self.memory.chat_memory.add_user_message(content)
-                else:
-                    self.memory.chat_memory.add_ai_message(content)
+            self._rehydrate(previous_msgs)
             print(f"🔁 Rehidratada memoria con {len(previous_msgs)} mensajes previos.\n")
         else:
             print("🆕 Nueva sesión — memoria vacía.\n")
+        return True
+
+    def _rehydrate(self, messages: list[dict]):
+        """Reconstruye el buffer RAM desde una lista de mensajes persistidos."""
+        self.memory.chat_memory.clear()
+        for m in messages:
+            role = m["role"].lower()
+            content = m["content"]
+            if role == "user":
+                self.memory.chat_memory.add_user_message(content)
+            else:
+                self.memory.chat_memory.add_ai_message(content)
+
+    def refresh(self) -> bool:
+        """Rehidrata el buffer si otro worker/pestaña escribió el .pkl.
+
+        Devuelve True si hubo que recargar.
+        """
+        if not self.logger.is_stale():
+            return False
+        messages = self.logger.load()
+        self._rehydrate(messages)
+        print(f"🔄 Memoria recargada desde disco ({len(messages)} msgs).")
+        return True
 
     # ────────────────────────────────────────────
     #   MAIN QUERY PIPELINE
     # ────────────────────────────────────────────
     def query(self, user_input: str, k: int = 3) -> str:
+        """Responde ``user_input``. Persiste la pregunta; la respuesta debe
+        guardarla el llamador con ``self.logger.save("assistant", …)``.
+        """
+        from langchain_core.prompts import PromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.runnables import RunnablePassthrough
+
         # Registrar mensaje
         self.logger.save("user", user_input)
         self.memory.chat_memory.add_user_message(user_input)
 
         # Paso 1: búsqueda semántica top‑k en context.md
         relevant_docs = self.vector_store.query(user_input, k=k)
-        snippets = "\n\n".join(
-            [doc.page_content[:800] for doc in relevant_docs]
-        )
 
         # Paso 2: preparar prompt base
         template = PromptTemplate(
@@ -91,81 +115,85 @@ class R4RConversationalRAG:
             ),
         )
 
-        # Dump temporal del buffer como string
-        conversation_text = "\n".join(
-            f"{m.type}: {m.content}" for m in self.memory.chat_memory.messages[-8:]
-        )
+        # Paso 3: empaquetar contexto + conversación (sin la pregunta actual)
+        # dentro del presupuesto de tokens, sin pasajes duplicados
+        history = [(m.type, m.content) for m in self.memory.chat_memory.messages[:-1]]
+        budget = self.packer.available_budget(template.template, user_input)
+        packed = self.packer.pack(relevant_docs, history, user_input, budget)
+        print(f"📦 Prompt: {packed.stats}")
 
         chain = RunnablePassthrough() | template | self.llm | StrOutputParser()
 
         response = chain.invoke(
             {
-                "context": snippets,
-                "conversation": conversation_text,
+                "context": packed.context,
+                "conversation": packed.conversation,
                 "question": user_input,
             }
         )
 
-        # Guardar mensaje en buffer y persistente con metadatos
+        # Guardar mensaje en buffer; el .pkl lo escribe quien llama
+        # (una sola vez, con las métricas del HUD ya medidas)
         self.memory.chat_memory.add_ai_message(response)
-        try:
-            from os import getenv
-            self.logger.save(
-                "assistant",
-                response,
-                {
-                    "metrics": {
-                        "length": len(response.split())
-                    },
-                    "model": getenv("MODEL_NAME", "undefined"),
-                }
-            )
-        except Exception as e:
-            print(f"[⚠️] Error guardando metadatos: {e}")
-
         return response
 
     # ────────────────────────────────────────────
     #   FINALIZACIÓN / GUARDADO
     # ────────────────────────────────────────────
     def finalize(self):
-        """Resincroniza buffer RAM → .pkl manteniendo los metadatos previos."""
-        from pathlib import Path
+        """Resincroniza buffer RAM → .pkl manteniendo los metadatos previos.
+
+        Se hace bajo el lock de la fase. Si otro proceso escribió desde nuestra
+        última sync, el .pkl (que ya contiene nuestros mensajes, guardados uno
+        a uno por ``SessionLogger.save``) es la fuente de verdad: se rehidrata
+        la RAM en lugar de pisar el disco con un buffer desactualizado.
+        """
         import pickle
-    
-        # 1️⃣ Cargar versión actual (si existe)
-        existing = []
-        if self.logger.memory_path.exists():
-            try:
-                with open(self.logger.memory_path, "rb") as f:
-                    existing = pickle.load(f)
-            except Exception:
-                existing = []
-    
-        # 2️⃣ Reconstruir mensajes del buffer actual
-        updated = []
-        for m in self.memory.chat_memory.messages:
-            role = "user" if m.type == "human" else "assistant"
-            content = m.content
-            updated.append({"role": role, "content": content})
-    
-        # 3️⃣ Si los existentes tenían meta (metrics, model),
-        #     los transferimos al matching assistant original.
-        merged = []
-        for idx, msg in enumerate(updated):
-            if msg["role"] == "assistant":
-                # Recuperar meta del existente si coincide por orden
-                meta = None
-                if idx < len(existing) and isinstance(existing[idx], dict):
-                    meta = existing[idx].get("meta")
-                if meta:
-                    msg["meta"] = meta
-            merged.append(msg)
-    
-        # 4️⃣ Guardar sin perder meta
-        tmp_path = self.logger.memory_path.with_suffix(".pkl.tmp")
-        with open(tmp_path, "wb") as f:
-            pickle.dump(merged, f)
-        tmp_path.replace(self.logger.memory_path)
-    
+
+        with self.logger.locked():
+            self.logger.thaw()
+            # 1️⃣ Cargar versión actual (si existe)
+            existing = []
+            if self.logger.memory_path.exists():
+                try:
+                    with open(self.logger.memory_path, "rb") as f:
+                        existing = pickle.load(f)
+                except Exception:
+                    existing = []
+
+            if self.logger.is_stale():
+                self._rehydrate(existing)
+                self.logger.synced_signature = memory_signature(self.logger.memory_path)
+                print(f"🔄 Escritura concurrente detectada; RAM recargada desde {self.logger.memory_path}")
+                return
+
+            # 2️⃣ Reconstruir mensajes del buffer actual
+            updated = []
+            for m in self.memory.chat_memory.messages:
+                role = "user" if m.type == "human" else "assistant"
+                content = m.content
+                updated.append({"role": role, "content": content})
+
+            # 3️⃣ Si los existentes tenían meta (metrics, model) o timestamp,
+            #     los transferimos al mensaje original (los rollups por hora
+            #     de analytics.py dependen del timestamp).
+            merged = []
+            for idx, msg in enumerate(updated):
+                previous = existing[idx] if idx < len(existing) and isinstance(existing[idx], dict) else {}
+                if previous.get("timestamp"):
+                    msg = {"timestamp": previous["timestamp"], **msg}
+                if msg["role"] == "assistant":
+                    # Recuperar meta del existente si coincide por orden
+                    meta = previous.get("meta")
+                    if meta:
+                        msg["meta"] = meta
+                merged.append(msg)
+
+            # 4️⃣ Guardar sin perder meta (escritura atómica)
+            tmp_path = self.logger.memory_path.with_suffix(".pkl.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(merged, f)
+            tmp_path.replace(self.logger.memory_path)
+            self.logger.synced_signature = memory_signature(self.logger.memory_path)
+
         print(f"💾 Memoria sincronizada preservando metadatos → {self.logger.memory_path}")
@@ -0,0 +1,101 @@
+# r4r_core/session_state.py
+# -------------------------------------------------------------
+# Estado de sesión compartible entre workers (flags "en curso").
+#   - LocalSessionState  → set en memoria del proceso (1 worker)
+#   - SQLiteSessionState → fichero SQLite compartido (N workers)
+# Se elige con R4R_SESSION_BACKEND=local|sqlite
+# -------------------------------------------------------------
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class LocalSessionState:
+    """Flags en memoria del proceso. Válido solo con un único worker."""
+
+    def __init__(self):
+        self._flags: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, ttl: float = 600.0) -> bool:
+        """Marca ``key`` como en curso. False si ya lo estaba (y no ha caducado)."""
+        now = time.time()
+        with self._lock:
+            expires = self._flags.get(key)
+            if expires is not None and expires > now:
+                return False
+            self._flags[key] = now + ttl
+            return True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._flags.pop(key, None)
+
+    def is_active(self, key: str) -> bool:
+        with self._lock:
+            expires = self._flags.get(key)
+            return expires is not None and expires > time.time()
+
+
+class SQLiteSessionState:
+    """Flags en un fichero SQLite compartido por todos los workers.
+
+    El TTL evita que un worker caído deje una clave bloqueada para siempre.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flags ("
+                " key TEXT PRIMARY KEY, expires REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, key: str, ttl: float = 600.0) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM flags WHERE key = ? AND expires <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO flags (key, expires) VALUES (?, ?)",
+                (key, now + ttl),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def release(self, key: str) -> None:
+        self._conn().execute("DELETE FROM flags WHERE key = ?", (key,))
+
+    def is_active(self, key: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM flags WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+
+def get_session_state(projects_dir: Path):
+    """Instancia el backend configurado en .env (por defecto ``local``)."""
+    backend = os.getenv("R4R_SESSION_BACKEND", "local").lower()
+    if backend == "local":
+        return LocalSessionState()
+    if backend == "sqlite":
+        db_path = os.getenv("R4R_SESSION_DB") or Path(projects_dir) / ".r4r_state.sqlite"
+        return SQLiteSessionState(Path(db_path))
+    raise ValueError(f"Backend de sesión no soportado: {backend}")
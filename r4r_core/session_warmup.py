@@ -0,0 +1,231 @@
+# r4r_core/session_warmup.py
+# -------------------------------------------------------------
+# Precalentamiento de sesiones (project, phase) en segundo plano:
+# al abrir una fase en la sidebar se indexan contextos, se rehidrata
+# la memoria y se carga el modelo antes del primer mensaje.
+#   - dedup: una sola tarea por clave aunque lleguen N peticiones
+#     (también mientras una tarea cancelada sigue terminando)
+#   - cancelación cooperativa cuando el cliente cambia de fase
+#   - estado consultable por el HUD (idle|warming|ready|cancelled|error)
+# SessionCache acota las sesiones vivas del proceso (LRU + TTL de
+# inactividad): abrir fases en la sidebar no las retiene para siempre.
+# -------------------------------------------------------------
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+
+
+@dataclass
+class _WarmupJob:
+    future: Future
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    status: str = "warming"
+    error: str = ""
+    clients: set[str] = field(default_factory=set)
+
+
+class WarmupManager:
+    """Ejecuta ``build(key, cancelled)`` una vez por clave en un pool de hilos.
+
+    ``build`` debe comprobar ``cancelled.is_set()`` entre pasos caros y
+    devolver False si abandonó el trabajo.
+    """
+
+    def __init__(self, build: Callable[[Hashable, threading.Event], bool], max_workers: int = 2):
+        self._build = build
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="r4r-warmup")
+        self._lock = threading.Lock()
+        self._jobs: dict[Hashable, _WarmupJob] = {}
+        self._client_keys: dict[str, Hashable] = {}
+
+    def start(self, key: Hashable, client: str | None = None) -> str:
+        """Lanza (o reutiliza) el warm‑up de ``key`` y devuelve su estado.
+
+        Si ``client`` estaba calentando otra clave, esa tarea se cancela
+        salvo que otro cliente siga interesado en ella.
+        """
+        with self._lock:
+            if client:
+                previous = self._client_keys.get(client)
+                if previous is not None and previous != key:
+                    self._release_client(previous, client)
+                self._client_keys[client] = key
+
+            job = self._jobs.get(key)
+            if job is not None and not job.future.done() and job.cancelled.is_set():
+                # sigue en marcha (cancelada): se reanima en vez de lanzar otra
+                job.cancelled.clear()
+                job.status = "warming"
+            elif job is None or job.status in ("cancelled", "error"):
+                job = _WarmupJob(future=Future())
+                self._jobs[key] = job
+                job.future = self._pool.submit(self._run, key, job)
+            if client:
+                job.clients.add(client)
+            return job.status
+
+    def _release_client(self, key: Hashable, client: str) -> None:
+        job = self._jobs.get(key)
+        if job is None:
+            return
+        job.clients.discard(client)
+        if not job.clients and job.status == "warming":
+            job.cancelled.set()
+            job.status = "cancelled"
+            print(f"[⏹️] Warm‑up cancelado: {key}")
+
+    def _run(self, key: Hashable, job: _WarmupJob) -> None:
+        try:
+            done = self._build(key, job.cancelled)
+        except Exception as e:
+            with self._lock:
+                job.status, job.error = "error", str(e)
+            print(f"[⚠️] Warm‑up fallido {key}: {e}")
+            return
+        with self._lock:
+            if done and not job.cancelled.is_set():
+                job.status = "ready"
+            elif not done and not job.cancelled.is_set() and self._jobs.get(key) is job:
+                # reanimada mientras abandonaba: se relanza sobre el mismo job
+                job.future = self._pool.submit(self._run, key, job)
+            else:
+                job.status = "cancelled"
+
+    def cancel(self, key: Hashable) -> None:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job.status == "warming":
+                job.cancelled.set()
+                job.status = "cancelled"
+
+    def status(self, key: Hashable) -> dict:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return {"status": "idle"}
+            return {"status": job.status, "error": job.error}
+
+    def wait(self, key: Hashable, timeout: float | None = None) -> str:
+        """Espera a un warm‑up en curso (p. ej. llega un mensaje mientras calienta)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                job = self._jobs.get(key)
+                if job is None:
+                    return "idle"
+                if job.status != "warming":
+                    return job.status
+                future = job.future
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return job.status
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                pass
+            if future is job.future:  # no se relanzó: estado definitivo
+                return job.status
+
+    def forget(self, key: Hashable) -> None:
+        """Olvida el estado de ``key`` (la sesión se cerró o se eliminó)."""
+        with self._lock:
+            job = self._jobs.pop(key, None)
+            if job:
+                job.cancelled.set()
+
+
+class SessionCache(MutableMapping):
+    """Dict de sesiones vivas con desalojo LRU y TTL de inactividad.
+
+    Cada acceso (``get``, ``in``, ``[]``) renueva la entrada. Al superar
+    ``max_size`` se desaloja la menos usada; las inactivas más de
+    ``idle_ttl`` segundos se purgan al insertar o consultar. ``on_evict``
+    recibe ``(key, value)`` de cada desalojo (no de ``pop``/``del``).
+    """
+
+    def __init__(
+        self,
+        max_size: int = 8,
+        idle_ttl: float = 1800.0,
+        on_evict: Callable[[Hashable, Any], None] | None = None,
+    ):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self._lock = threading.RLock()
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def _expired(self, last_used: float, now: float) -> bool:
+        return self.idle_ttl > 0 and now - last_used > self.idle_ttl
+
+    def _purge(self) -> list[tuple[Hashable, Any]]:
+        """Saca expiradas y exceso LRU (requiere el lock)."""
+        now = time.monotonic()
+        evicted = []
+        for key, (value, last_used) in list(self._data.items()):
+            if self._expired(last_used, now):
+                evicted.append((key, self._data.pop(key)[0]))
+        while self.max_size > 0 and len(self._data) > self.max_size:
+            key, (value, _) = self._data.popitem(last=False)
+            evicted.append((key, value))
+        return evicted
+
+    def _notify(self, evicted: list[tuple[Hashable, Any]]) -> None:
+        for key, value in evicted:
+            print(f"[🧹] Sesión desalojada de memoria: {key}")
+            if self.on_evict:
+                try:
+                    self.on_evict(key, value)
+                except Exception as e:
+                    print(f"[⚠️] Error al desalojar {key}: {e}")
+
+    def __getitem__(self, key):
+        with self._lock:
+            value, last_used = self._data[key]
+            now = time.monotonic()
+            if self._expired(last_used, now):
+                del self._data[key]
+                evicted = [(key, value)]
+            else:
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+                return value
+        self._notify(evicted)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            evicted = self._purge()
+        self._notify(evicted)
+
+    def setdefault(self, key, default=None):
+        with self._lock:
+            try:
+                return self[key]
+            except KeyError:
+                self[key] = default
+                return default
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """Instantánea ``[(key, value), …]`` (no renueva las entradas)."""
+        with self._lock:
+            return [(k, v) for k, (v, _) in self._data.items()]
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            del self._data[key]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -1,14 +1,10 @@
 # r4r_core/summarizer_chain.py
 # -----------------------------------------------------------
 # Genera un resumen semántico usando el modelo elegido (.env)
+# Solo se importa el backend del proveedor seleccionado.
 # -----------------------------------------------------------
 
 import os
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
 
@@ -19,10 +15,13 @@ def get_llm():
     model_name = os.getenv("MODEL_NAME", "mistral:7b")
 
     if "ollama" in provider:
-        # Ollama local o cloud: usa el endpoint local por defecto
-        base_url = os.getenv("OLLAMA_API_HOST", "http://localhost:11434")
-        return ChatOllama(model=model_name, base_url=base_url, temperature=0.3)
+        # Ollama local o cloud: router sobre R4R_LLM_BACKENDS / OLLAMA_API_HOST
+        from r4r_core.llm_router import routed_chat_model
+
+        return routed_chat_model()
     elif "openai" in provider:
+        from langchain_openai import ChatOpenAI
+
         api_key = os.getenv("OPENAI_API_KEY")
         return ChatOpenAI(model_name=model_name, api_key=api_key, temperature=0.3)
     else:
@@ -31,6 +30,10 @@ def get_llm():
 
 def summarize_conversation(messages: list[dict]) -> str:
     """Crea un resumen semántico real vía LLM."""
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnablePassthrough
+
     llm = get_llm()
 
     # Unimos mensajes de usuario en un solo texto
@@ -1,38 +1,330 @@
 # r4r_core/vector_store.py
 # -------------------------------------------------------------
-# Vector store en memoria (RAM) con Chroma y OllamaEmbeddings.
-# Sin persist_dir -> evita errores de escritura en SQLite.
-# Los contextos se indexan al vuelo cuando se abre fase/proyecto.
+# Vector store en memoria (RAM) con OllamaEmbeddings y backend
+# enchufable:
+#   - NumpyVectorBackend  → matriz float32 contigua (opcional mmap),
+#                           top‑k exacto por producto escalar. Proyectos
+#                           pequeños (la mayoría: pocos context.md).
+#   - ChromaVectorBackend → colección Chroma en memoria (sin persist_dir
+#                           -> evita errores de escritura en SQLite).
+# R4R_VECTOR_BACKEND=auto|numpy|chroma (auto: numpy si el proyecto
+# tiene <= R4R_VECTOR_NUMPY_MAX_DOCS contextos).
+# Los contextos se indexan al vuelo cuando se abre fase/proyecto,
+# en streaming: lotes acotados → workers de embeddings (con reintentos
+# y backoff) → commit parcial de cada lote en el backend.
+# Chroma/Ollama/NumPy se importan al instanciar (no al importar el módulo).
 # -------------------------------------------------------------
 
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from langchain_core.documents import Document
+from typing import Iterable, Iterator
+
+
+class ChromaVectorBackend:
+    """Colección Chroma efímera, una por instancia.
+
+    El cliente efímero de chromadb es compartido por todo el proceso: un
+    nombre fijo mezclaría los documentos de todas las sesiones/proyectos.
+    """
+
+    name = "chroma"
+
+    def __init__(self, embeddings):
+        from langchain_chroma import Chroma
 
-class R4RVectorStore:
-    def __init__(self):
-        # modelo de embeddings
-        self.embeddings = OllamaEmbeddings(model="nomic-embed-text")
-        # colección en memoria
         self.vectorstore = Chroma(
-            collection_name="r4r_temp",
-            embedding_function=self.embeddings
+            collection_name=f"r4r_{uuid.uuid4().hex}",
+            embedding_function=embeddings,
+        )
+
+    def close(self) -> None:
+        """Elimina la colección del cliente compartido (libera memoria)."""
+        try:
+            self.vectorstore.delete_collection()
+        except Exception as e:
+            print(f"[⚠️] No se pudo eliminar la colección Chroma: {e}")
+
+    def add_documents(self, docs: list) -> None:
+        self.vectorstore.add_documents(docs)
+
+    def add_embedded(self, docs: list, vectors: list) -> None:
+        """Inserta documentos con embeddings ya calculados (sin re‑embeber)."""
+        self.vectorstore._collection.upsert(
+            ids=[uuid.uuid4().hex for _ in docs],
+            embeddings=[list(v) for v in vectors],
+            documents=[d.page_content for d in docs],
+            metadatas=[d.metadata or None for d in docs],
+        )
+
+    def similarity_search(self, question: str, k: int = 3, phase: str | None = None) -> list:
+        where = {"phase": phase} if phase else None
+        return self.vectorstore.similarity_search(question, k=k, filter=where)
+
+    def max_marginal_relevance_search(
+        self, question: str, k: int = 3, fetch_k: int = 20,
+        lambda_mult: float = 0.5, phase: str | None = None,
+    ) -> list:
+        where = {"phase": phase} if phase else None
+        return self.vectorstore.max_marginal_relevance_search(
+            question, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=where
         )
 
-    def index_contexts(self, project_dir: Path):
-        """Leer todos los context.md del proyecto y generar embeddings en RAM."""
-        contexts = []
-        for md in project_dir.rglob("context.md"):
-            phase_name = md.parent.name
+
+class NumpyVectorBackend:
+    """Búsqueda exacta por fuerza bruta sobre una matriz float32 normalizada.
+
+    Las filas se guardan normalizadas (L2), así el producto escalar es la
+    similitud coseno. Con ``mmap_path`` la matriz se vuelca a un ``.npy``
+    y se relee con ``mmap_mode="r"`` (las páginas las comparte el SO).
+    """
+
+    name = "numpy"
+
+    def __init__(self, embeddings, mmap_path: Path | None = None):
+        import numpy as np
+
+        self._np = np
+        self.embeddings = embeddings
+        self.mmap_path = Path(mmap_path) if mmap_path else None
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.docs: list = []
+        self.phases = np.empty(0, dtype=object)
+
+    # ---------- indexado ----------
+    def _normalize(self, vectors):
+        np = self._np
+        arr = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return arr / norms
+
+    def add_documents(self, docs: list) -> None:
+        if not docs:
+            return
+        self.add_embedded(docs, self.embeddings.embed_documents([d.page_content for d in docs]))
+
+    def add_embedded(self, docs: list, vectors: list) -> None:
+        """Añade filas con embeddings ya calculados (commit de un lote)."""
+        np = self._np
+        vectors = self._normalize(vectors)
+        matrix = vectors if self.matrix.size == 0 else np.concatenate([self.matrix, vectors])
+        if self.mmap_path:
+            # soltar el mmap previo antes de reescribir el .npy (Windows lo bloquea)
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+            self.mmap_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(self.mmap_path, matrix)
+            matrix = np.load(self.mmap_path, mmap_mode="r")
+        self.matrix = matrix
+        self.docs.extend(docs)
+        self.phases = np.array([d.metadata.get("phase") for d in self.docs], dtype=object)
+
+    # ---------- búsqueda ----------
+    def _scores(self, question: str, phase: str | None):
+        np = self._np
+        q = self._normalize(self.embeddings.embed_query(question))
+        scores = self.matrix @ q
+        if phase:
+            scores = np.where(self.phases == phase, scores, -np.inf)
+        return q, scores
+
+    def _top_k(self, scores, k: int):
+        np = self._np
+        valid = int(np.isfinite(scores).sum())
+        k = min(k, valid)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        if k < len(scores):
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(len(scores))
+        return idx[np.argsort(-scores[idx])][:k]
+
+    def similarity_search(self, question: str, k: int = 3, phase: str | None = None) -> list:
+        if not self.docs:
+            return []
+        _, scores = self._scores(question, phase)
+        return [self.docs[i] for i in self._top_k(scores, k)]
+
+    def max_marginal_relevance_search(
+        self, question: str, k: int = 3, fetch_k: int = 20,
+        lambda_mult: float = 0.5, phase: str | None = None,
+    ) -> list:
+        """Re‑ranking MMR sobre los ``fetch_k`` candidatos más similares."""
+        if not self.docs:
+            return []
+        np = self._np
+        _, scores = self._scores(question, phase)
+        candidates = self._top_k(scores, max(k, fetch_k))
+        if len(candidates) == 0:
+            return []
+
+        cand_vecs = np.asarray(self.matrix[candidates])
+        relevance = scores[candidates]
+        selected: list[int] = []
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+        for _ in range(min(k, len(candidates))):
+            mmr = lambda_mult * relevance - (1 - lambda_mult) * np.maximum(redundancy, 0)
+            mmr[selected] = -np.inf
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            redundancy = np.maximum(redundancy, cand_vecs @ cand_vecs[best])
+        return [self.docs[candidates[i]] for i in selected]
+
+
+def iter_context_documents(paths: Iterable[Path]) -> Iterator:
+    """Lee los context.md uno a uno y los entrega como ``Document``."""
+    from langchain_core.documents import Document
+
+    for md in paths:
+        try:
             with open(md, "r", encoding="utf-8") as f:
-                contexts.append(Document(page_content=f.read(), metadata={"phase": phase_name}))
-        if not contexts:
+                text = f.read()
+        except OSError as e:
+            print(f"[⚠️] No se pudo leer {md}: {e}")
+            continue
+        yield Document(page_content=text, metadata={"phase": md.parent.name})
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def embed_with_retry(embeddings, texts: list[str], retries: int = 3, backoff: float = 0.5) -> list:
+    """``embed_documents`` con reintentos y backoff exponencial (timeouts de Ollama)."""
+    for attempt in range(retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"[⚠️] Embeddings fallaron ({e}); reintento {attempt + 1}/{retries} en {delay:.1f}s")
+            time.sleep(delay)
+
+
+def choose_backend(n_docs: int) -> str:
+    """Decide backend según .env y tamaño del proyecto."""
+    backend = os.getenv("R4R_VECTOR_BACKEND", "auto").lower()
+    if backend in ("numpy", "chroma"):
+        return backend
+    if backend != "auto":
+        raise ValueError(f"Backend vectorial no soportado: {backend}")
+    max_docs = int(os.getenv("R4R_VECTOR_NUMPY_MAX_DOCS", 64))
+    return "numpy" if n_docs <= max_docs else "chroma"
+
+
+class R4RVectorStore:
+    def __init__(self, backend: str | None = None, mmap_path: Path | None = None):
+        from langchain_ollama import OllamaEmbeddings
+
+        # modelo de embeddings
+        self.embeddings = OllamaEmbeddings(model="nomic-embed-text")
+        # backend fijo o elegido al indexar (según nº de contextos)
+        self.backend_name = backend
+        self.mmap_path = mmap_path
+        self.backend = None
+
+    def _build_backend(self, n_docs: int):
+        name = self.backend_name or choose_backend(n_docs)
+        if name == "numpy":
+            return NumpyVectorBackend(self.embeddings, mmap_path=self.mmap_path)
+        return ChromaVectorBackend(self.embeddings)
+
+    def index_contexts(
+        self,
+        project_dir: Path,
+        batch_size: int | None = None,
+        concurrency: int | None = None,
+        retries: int | None = None,
+        cancelled: threading.Event | None = None,
+    ) -> dict:
+        """Indexa todos los context.md del proyecto en streaming.
+
+        Los lotes se embeben en ``concurrency`` hilos con como mucho
+        ``concurrency`` lotes en vuelo (backpressure sobre la lectura).
+        Cada lote se confirma en el backend en cuanto termina, así que un
+        fallo persistente solo pierde ese lote. Si ``cancelled`` se activa
+        (warm‑up abandonado) no se lanzan más lotes y el resultado queda
+        marcado con ``"cancelled": True``. Devuelve estadísticas.
+        """
+        batch_size = batch_size or int(os.getenv("R4R_EMBED_BATCH_SIZE", 16))
+        concurrency = concurrency or int(os.getenv("R4R_EMBED_CONCURRENCY", 2))
+        retries = int(os.getenv("R4R_EMBED_RETRIES", 3)) if retries is None else retries
+
+        paths = list(project_dir.rglob("context.md"))
+        if not paths:
             print("⚠️ No se encontraron context.md para indexar.")
-            return
-        self.vectorstore.add_documents(contexts)
-        print(f"✅ Indexados {len(contexts)} contextos en memoria.")
+            return {"docs": 0, "failed": 0, "seconds": 0.0, "docs_per_s": 0.0, "words_per_s": 0.0}
+        if self.backend is None:
+            self.backend = self._build_backend(len(paths))
+
+        stats = {"docs": 0, "failed": 0, "batches": 0, "words": 0, "cancelled": False}
+        start = time.perf_counter()
+
+        def commit(future, batch):
+            try:
+                vectors = future.result()
+            except Exception as e:
+                stats["failed"] += len(batch)
+                print(f"[❌] Lote de {len(batch)} contextos descartado tras {retries} reintentos: {e}")
+                return
+            self.backend.add_embedded(batch, vectors)
+            stats["docs"] += len(batch)
+            stats["batches"] += 1
+            stats["words"] += sum(len(d.page_content.split()) for d in batch)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="r4r-embed") as pool:
+            in_flight = {}
+            for batch in batched(iter_context_documents(paths), batch_size):
+                if cancelled is not None and cancelled.is_set():
+                    stats["cancelled"] = True
+                    break
+                if len(in_flight) >= concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        commit(fut, in_flight.pop(fut))
+                texts = [d.page_content for d in batch]
+                in_flight[pool.submit(embed_with_retry, self.embeddings, texts, retries)] = batch
+            for fut in list(in_flight):
+                batch = in_flight.pop(fut)
+                if stats["cancelled"] and fut.cancel():
+                    continue
+                commit(fut, batch)
+
+        elapsed = time.perf_counter() - start
+        if stats["cancelled"]:
+            print(f"[⏹️] Indexado cancelado tras {stats['docs']}/{len(paths)} contextos")
+        stats["seconds"] = round(elapsed, 3)
+        stats["docs_per_s"] = round(stats["docs"] / max(elapsed, 1e-6), 2)
+        stats["words_per_s"] = round(stats["words"] / max(elapsed, 1e-6), 2)
+        print(
+            f"✅ Indexados {stats['docs']} contextos en memoria ({self.backend.name}) — "
+            f"{stats['docs_per_s']} docs/s, {stats['words_per_s']} palabras/s"
+            + (f", {stats['failed']} fallidos" if stats["failed"] else "")
+        )
+        return stats
+
+    def close(self) -> None:
+        """Libera el backend (la colección Chroma no se recoge sola)."""
+        backend, self.backend = self.backend, None
+        if backend is not None and hasattr(backend, "close"):
+            backend.close()
+
+    def query(self, question: str, k: int = 3, phase: str | None = None, mmr: bool = False):
+        """Búsqueda semántica en el vectorstore temporal.
 
-    def query(self, question: str, k: int = 3):
-        """Búsqueda semántica en el vectorstore temporal."""
-        return self.vectorstore.similarity_search(question, k=k)
+        ``phase`` filtra por metadato de fase; ``mmr`` re‑ordena por MMR
+        para diversificar los fragmentos devueltos.
+        """
+        if self.backend is None:
+            return []
+        if mmr:
+            return self.backend.max_marginal_relevance_search(question, k=k, phase=phase)
+        return self.backend.similarity_search(question, k=k, phase=phase)
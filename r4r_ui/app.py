@@ -6,17 +6,18 @@
 import os, re, uuid, json, shutil, pickle, time
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify
+from typing import TYPE_CHECKING
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_socketio import SocketIO
 from dotenv import load_dotenv
 
-from r4r_core.rag_chain import R4RConversationalRAG
-from r4r_core.conversation_persistence import load_memory
-from r4r_core.context_builder import generate_context_md
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from r4r_core.session_state import get_session_state
+from r4r_core.session_warmup import SessionCache, WarmupManager
+
+# LangChain / Chroma / proveedores se importan en el primer uso (arranque rápido):
+# ver benchmarks/startup_importtime.py
+if TYPE_CHECKING:
+    from r4r_core.rag_chain import R4RConversationalRAG
 
 # ----------------------------------------------------------
 load_dotenv()
@@ -24,8 +25,19 @@ app = Flask(__name__, static_folder="static", template_folder="templates")
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
 
 PROJECTS_DIR = Path(os.getenv("PROJECTS_DIR", "projects"))
-sessions: dict[tuple[str, str], R4RConversationalRAG] = {}
-saving_state: set[str] = set()
+# RAG vivos de ESTE proceso (cache LRU + TTL); el .pkl con lock es la fuente
+# de verdad, así que desalojar una sesión solo cuesta re‑indexar al volver
+def _evict_session(key: tuple[str, str], rag: "R4RConversationalRAG") -> None:
+    warmups.forget(key)
+    rag.vector_store.close()
+
+sessions = SessionCache(
+    max_size=int(os.getenv("R4R_SESSION_CACHE_SIZE", 8)),
+    idle_ttl=float(os.getenv("R4R_SESSION_IDLE_TTL", 1800)),
+    on_evict=_evict_session,
+)
+# flags "guardando" compartidos entre workers (R4R_SESSION_BACKEND=local|sqlite)
+session_state = get_session_state(PROJECTS_DIR)
 
 # ======================================================
 # HELPERS
@@ -34,6 +46,55 @@ saving_state: set[str] = set()
 def make_uuid() -> str:
     return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
+def _warm_session(key: tuple[str, str], cancelled) -> bool:
+    """Construye el RAG de (project, phase) en segundo plano.
+
+    Pasos: indexado + rehidratación (initialize) y carga del modelo.
+    La cancelación se comprueba entre lotes de embeddings y entre pasos;
+    el resultado se publica en ``sessions`` solo si nadie lo ha creado ya.
+    """
+    from r4r_core.rag_chain import R4RConversationalRAG
+    from r4r_core.llm_router import get_router
+
+    if key in sessions or cancelled.is_set():
+        return key in sessions
+    project, phase = key
+    rag = R4RConversationalRAG(PROJECTS_DIR / project, phase)
+    if not rag.initialize(cancelled=cancelled) or cancelled.is_set():
+        rag.vector_store.close()
+        return False
+    if sessions.setdefault(key, rag) is not rag:
+        # otro hilo (mensaje en línea) publicó antes: soltar nuestra colección
+        rag.vector_store.close()
+    get_router().preload()
+    print(f"🔥 Sesión precalentada: {project}/{phase}")
+    return True
+
+# precalentamiento al abrir una fase desde la sidebar (ver /api/history)
+warmups = WarmupManager(_warm_session, max_workers=int(os.getenv("R4R_WARMUP_WORKERS", 2)))
+# segundos que /api/message espera a un warm‑up en curso antes de construir la sesión
+WARMUP_WAIT = float(os.getenv("R4R_WARMUP_WAIT", 15))
+
+def existing_phase_dir(project: str | None, phase: str | None) -> Path | None:
+    """Carpeta de la fase si existe y queda dentro de PROJECTS_DIR.
+
+    El warm‑up crea el RAG (y su SessionLogger crea carpetas), así que
+    solo se lanza para fases reales: nada de ``../..`` ni fases inventadas.
+    """
+    names = (project, phase)
+    if not all(names) or any("/" in n or "\\" in n or n in (".", "..") for n in names):
+        return None
+    root = PROJECTS_DIR.resolve()
+    phase_dir = (PROJECTS_DIR / project / phase).resolve()
+    if phase_dir.parent.parent != root or not phase_dir.is_dir():
+        return None
+    return phase_dir
+
+def warmup_status(key: tuple[str, str]) -> dict:
+    if key in sessions:
+        return {"status": "ready", "error": ""}
+    return warmups.status(key)
+
 def slugify(name: str) -> str:
     slug = re.sub(r"[^a-zA-Z0-9]+", "_", name.strip())
     return slug.strip("_")
@@ -71,24 +132,30 @@ def list_projects():
 @app.route("/api/history", methods=["POST"])
 def load_history():
     from r4r_core.context_builder import load_existing_conversation
+    from r4r_core.cold_storage import archived_mtime
 
     data = request.get_json()
     project = data.get("project")
     phase = data.get("phase", "main")
 
+    # abrir la fase → precalentar su sesión mientras el usuario lee
+    key = (project, phase)
+    if key not in sessions and existing_phase_dir(project, phase):
+        warmups.start(key, client=data.get("client"))
+
     pkl_path = PROJECTS_DIR / project / phase / f"contextmemory_{phase}.pkl"
     ctx_path = PROJECTS_DIR / project / phase / "context.md"
 
     messages = []
-    if pkl_path.exists():
-        try:
-            messages = load_existing_conversation(pkl_path)
-        except FileNotFoundError:
-            messages = []
+    try:
+        # también sirve fases frías (.r4ra) sin descongelarlas
+        messages = load_existing_conversation(pkl_path)
+    except FileNotFoundError:
+        messages = []
 
     ctx_exists = ctx_path.exists()
     ctx_time = ctx_path.stat().st_mtime if ctx_exists else 0
-    memory_time = pkl_path.stat().st_mtime if pkl_path.exists() else 0
+    memory_time = pkl_path.stat().st_mtime if pkl_path.exists() else archived_mtime(pkl_path)
     pending = memory_time > ctx_time
 
     return jsonify({
@@ -96,11 +163,29 @@ def load_history():
         "context_exists": ctx_exists,
         "pending": pending,
         "memory_time": memory_time,
+        "warmup": warmup_status(key)["status"],
     })
 
+# ---------- ESTADO DE PRECALENTAMIENTO (HUD) ----------
+@app.route("/api/warmup", methods=["GET", "POST"])
+def warmup():
+    """GET → estado; POST → lanza (dedup) el warm‑up de project/phase."""
+    data = request.get_json(silent=True) or request.args
+    project = data.get("project")
+    phase = data.get("phase", "main")
+    if not existing_phase_dir(project, phase):
+        return jsonify({"error": "phase_not_found"}), 404
+
+    key = (project, phase)
+    if request.method == "POST" and key not in sessions:
+        warmups.start(key, client=data.get("client"))
+    return jsonify({"project": project, "phase": phase, **warmup_status(key)})
+
 # ---------- GUARDAR CONTEXTO Y CREAR NUEVA FASE ----------
 @app.route("/api/save_context", methods=["POST"])
 def save_context():
+    from r4r_core.context_builder import generate_context_md
+
     data = request.get_json() or {}
     project = data.get("project")
     phase = data.get("phase", "main")
@@ -110,33 +195,34 @@ def save_context():
         print(f"[❌] Proyecto inexistente: {project_dir}")
         return jsonify({"error": "project_not_found"}), 404
 
-    key = f"{project}:{phase}"
-    if key in saving_state:
+    key = f"saving:{project}:{phase}"
+    if not session_state.try_acquire(key):
         return jsonify({"status": "pending"}), 202
-    saving_state.add(key)
 
     try:
-        print(f"🔄 Generando context.md para {project}/{phase} ...")
-        generate_context_md(project, phase)
-    except Exception as e:
-        print(f"[❌] Error al generar context.md: {e}")
-        return jsonify({"error": "context_build_failed"}), 500
+        try:
+            print(f"🔄 Generando context.md para {project}/{phase} ...")
+            generate_context_md(project, phase)
+        except Exception as e:
+            print(f"[❌] Error al generar context.md: {e}")
+            return jsonify({"error": "context_build_failed"}), 500
+
+        # Crear siguiente fase vacía (dentro del flag: evita fases duplicadas
+        # si dos workers guardan la misma fase a la vez)
+        existing = [
+            p.name for p in project_dir.iterdir()
+            if p.is_dir() and p.name.lower().startswith("fase")
+        ]
+        next_index = len(existing) + 1
+        next_phase = f"fase {next_index}"
+        next_phase_dir = project_dir / next_phase
+        try:
+            next_phase_dir.mkdir(exist_ok=True)
+            (next_phase_dir / f"contextmemory_{next_phase}.pkl").touch()
+        except Exception as e:
+            print(f"[⚠️] Error creando nueva fase: {e}")
     finally:
-        saving_state.discard(key)
-
-    # Crear siguiente fase vacía
-    existing = [
-        p.name for p in project_dir.iterdir()
-        if p.is_dir() and p.name.lower().startswith("fase")
-    ]
-    next_index = len(existing) + 1
-    next_phase = f"fase {next_index}"
-    next_phase_dir = project_dir / next_phase
-    try:
-        next_phase_dir.mkdir(exist_ok=True)
-        (next_phase_dir / f"contextmemory_{next_phase}.pkl").touch()
-    except Exception as e:
-        print(f"[⚠️] Error creando nueva fase: {e}")
+        session_state.release(key)
 
     return jsonify({"saved": True, "next_phase": next_phase})
 
@@ -144,19 +230,21 @@ def save_context():
 @app.route("/api/message", methods=["POST"])
 def message_pipeline():
     """Procesa un mensaje del usuario y mantiene persistencia con HUD."""
+    from r4r_core.rag_chain import R4RConversationalRAG
+
     data = request.get_json()
     msg = data.get("message", "").strip()
     project = data.get("project")
     phase = data.get("phase", "main")
 
-    llm = ChatOllama(
-        model=os.getenv("MODEL_NAME", "mistral:7b"),
-        temperature=0.3,
-        base_url=os.getenv("OLLAMA_API_HOST", "http://localhost:11434"),
-    )
-
     # === NUEVO PROYECTO ===
     if not project:
+        from langchain_core.prompts import PromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.runnables import RunnablePassthrough
+        from r4r_core.llm_router import routed_chat_model
+
+        llm = routed_chat_model()
         uid = make_uuid()
         tmp_dir = PROJECTS_DIR / f"tmp_{uid}" / "main"
         tmp_dir.mkdir(parents=True, exist_ok=True)
@@ -232,11 +320,22 @@ def message_pipeline():
     # === PROYECTO EXISTENTE ===
     key = (project, phase)
     rag = sessions.get(key)
+    if not rag and warmups.wait(key, timeout=WARMUP_WAIT) == "ready":
+        # llegó el mensaje mientras se precalentaba: reutilizar ese trabajo
+        # (espera acotada: un warm‑up atascado no bloquea el mensaje)
+        rag = sessions.get(key)
     if not rag:
         project_dir = PROJECTS_DIR / project
-        rag = R4RConversationalRAG(project_dir, phase)
-        rag.initialize()
-        sessions[key] = rag
+        built = R4RConversationalRAG(project_dir, phase)
+        built.initialize()
+        # un warm‑up pudo publicar mientras tanto: se queda el ya publicado
+        rag = sessions.setdefault(key, built)
+        if rag is not built:
+            built.vector_store.close()
+            rag.refresh()
+    else:
+        # otro worker / pestaña pudo escribir esta fase desde la última vez
+        rag.refresh()
 
     start = time.perf_counter()
     response = rag.query(msg)
@@ -281,6 +380,11 @@ def project_manage(slug):
         return jsonify({"error": "not found"}), 404
 
     if request.method == "DELETE":
+        for key in [k for k in sessions if k[0] == slug]:
+            rag = sessions.pop(key, None)
+            warmups.forget(key)
+            if rag:
+                rag.vector_store.close()
         shutil.rmtree(project_dir)
         return jsonify({"deleted": True})
 
@@ -300,6 +404,60 @@ def project_manage(slug):
                 f.write("\n".join(lines))
         return jsonify({"renamed": True, "title": new_title})
 
+# ---------- ESTADÍSTICAS (rollups del HUD) ----------
+@app.route("/api/stats", methods=["GET"])
+def stats():
+    """Latencia / throughput agregados: ?by=model|project|hour [&key=…]."""
+    from r4r_core.analytics import get_rollup
+
+    by = request.args.get("by", "model")
+    try:
+        rows = get_rollup(PROJECTS_DIR).summary(by, request.args.get("key"))
+    except ValueError:
+        return jsonify({"error": "invalid_dimension"}), 400
+    return jsonify({"by": by, "rows": rows})
+
+# ---------- EXPORT / IMPORT (streaming) ----------
+@app.route("/api/project/<path:slug>/export", methods=["GET"])
+def project_export(slug):
+    """Descarga el proyecto como NDJSON+gzip en respuesta chunked.
+
+    ``?backups=0`` omite las carpetas backups/.
+    """
+    from r4r_core.project_transfer import export_project
+
+    project_dir = PROJECTS_DIR / slug
+    if not project_dir.is_dir():
+        return jsonify({"error": "not found"}), 404
+    include_backups = request.args.get("backups", "1").lower() not in ("0", "false", "no")
+    return Response(
+        stream_with_context(export_project(project_dir, include_backups)),
+        mimetype="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{project_dir.name}.r4r.ndjson.gz"'},
+    )
+
+@app.route("/api/project/import", methods=["POST"])
+def project_import():
+    """Importa un export leyendo el cuerpo de la petición por trozos."""
+    from r4r_core.project_transfer import CHUNK_SIZE, import_project
+
+    def body_chunks():
+        while chunk := request.stream.read(CHUNK_SIZE):
+            yield chunk
+
+    try:
+        result = import_project(body_chunks(), PROJECTS_DIR)
+    except (ValueError, OSError) as e:
+        print(f"[❌] Import fallido: {e}")
+        return jsonify({"error": "import_failed", "detail": str(e)}), 400
+
+    # el catálogo (/api/projects) se lee del disco; el índice vectorial se
+    # construye en segundo plano con el warm‑up de la fase main
+    if existing_phase_dir(result["project"], "main"):
+        warmups.start((result["project"], "main"))
+    print(f"📥 Proyecto importado: {result['project']} ({result['files']} ficheros)")
+    return jsonify({"imported": True, **result})
+
 # ---------- SOCKET.IO ----------
 @socketio.on("disconnect")
 def on_disconnect():
@@ -314,6 +472,9 @@ def on_disconnect():
     print(f"🔒 Sesión {sid} guardada y eliminada.")
 
 # ----------------------------------------------------------
+# Modo multi‑worker (Linux/macOS):
+#   R4R_SESSION_BACKEND=sqlite gunicorn -w 4 -b 127.0.0.1:5000 r4r_ui.app:app
+# El servidor de desarrollo de abajo es un único proceso con hilos.
 if __name__ == "__main__":
     host = os.getenv("FLASK_HOST", "127.0.0.1")
     port = int(os.getenv("FLASK_PORT", 5000))
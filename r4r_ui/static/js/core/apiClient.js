@@ -19,15 +19,21 @@ export const apiClient = {
     return json;
   },
 
-  async getHistory(project, phase) {
+  async getHistory(project, phase, client = null) {
     const r = await fetch("/api/history", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ project, phase }),
+      body: JSON.stringify({ project, phase, client }),
     });
     return await r.json();
   },
 
+  async getWarmup(project, phase) {
+    const params = new URLSearchParams({ project, phase });
+    const r = await fetch(`/api/warmup?${params}`);
+    return await r.json();
+  },
+
   async saveContext(project, phase) {
     const r = await fetch("/api/save_context", {
       method: "POST",
@@ -14,6 +14,12 @@ export const stateManager = {
   // Marca temporal del último guardado o carga
   lastMemoryTime: 0,
 
+  // Id de esta pestaña: el backend cancela el warm‑up de la fase anterior
+  clientId: crypto.randomUUID ? crypto.randomUUID() : String(Math.random()).slice(2),
+
+  // Estado del precalentamiento de la sesión activa (HUD)
+  warmup: "idle",
+
   /**
    * Actualiza el contexto actual (proyecto/fase/título visible)
    * Usado al crear un proyecto nuevo o al cambiar de fase en la sidebar.
@@ -33,7 +39,7 @@ export const stateManager = {
 
     try {
       console.log(`♻️ Cargando historial para ${project} / ${phase}`);
-      const data = await apiClient.getHistory(project, phase);
+      const data = await apiClient.getHistory(project, phase, this.clientId);
 
       // Actualizamos memoria temporal interna
       this.lastMemoryTime = data.memory_time || Date.now();
@@ -47,10 +53,42 @@ export const stateManager = {
         console.warn("⚠️ No hay historial disponible en backend.");
       }
 
+      this.watchWarmup(project, phase, data.warmup);
+
       // Devuelve los datos por si otros módulos los necesitan
       return data;
     } catch (err) {
       console.error("❌ Error al refrescar historial:", err);
     }
   },
+
+  /**
+   * Sigue el precalentamiento de la sesión (project, phase) mientras sea
+   * la activa y actualiza el indicador del header.
+   */
+  async watchWarmup(project, phase, status = "warming") {
+    const badge = document.getElementById("warmupBadge");
+    const labels = {
+      warming: "⏳ preparando sesión…",
+      ready: "⚡ sesión lista",
+      error: "⚠️ precarga fallida",
+    };
+    this.warmup = status;
+
+    while (
+      this.current.project === project &&
+      this.current.phase === phase
+    ) {
+      if (badge) badge.innerText = labels[this.warmup] || "";
+      if (this.warmup !== "warming") break;
+      await new Promise((r) => setTimeout(r, 1000));
+      try {
+        const res = await apiClient.getWarmup(project, phase);
+        this.warmup = res.status;
+      } catch (err) {
+        console.warn("⚠️ No se pudo consultar el warm‑up:", err);
+        break;
+      }
+    }
+  },
 };
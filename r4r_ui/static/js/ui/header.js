@@ -21,13 +21,17 @@ export function initHeader() {
   titleSpan.id = "sessionTitle";
   titleSpan.innerText = "Nuevo proyecto — pendiente";
 
+  // --- Indicador de precalentamiento de la sesión ---
+  const warmupBadge = document.createElement("span");
+  warmupBadge.id = "warmupBadge";
+
   // --- Botón de guardado ---
   const saveBtn = document.createElement("button");
   saveBtn.innerText = "Guardar";
   saveBtn.disabled = true;
 
   // --- Insertar en DOM ---
-  header.append(titleSpan, saveBtn);
+  header.append(titleSpan, warmupBadge, saveBtn);
 
   // --- Acción botón Guardar ---
   saveBtn.onclick = async () => {
@@ -133,10 +133,17 @@ export async function initSidebar(expandTitle = null) {
 
           // loader + fetch + render
           chatRenderer.showLoader();
-          const data = await apiClient.getHistory(p.project, ph);
+          const data = await apiClient.getHistory(
+            p.project,
+            ph,
+            stateManager.clientId
+          );
           chatRenderer.renderAll(data.history);
           chatRenderer.hideLoader();
 
+          // HUD: estado del precalentamiento de la sesión
+          stateManager.watchWarmup(p.project, ph, data.warmup);
+
           // actualizar header
           const titleSpan = document.getElementById("sessionTitle");
           if (titleSpan) {
@@ -172,10 +179,18 @@ function showContextMenu(x, y, slug, title) {
   menu.style.top = y + "px";
   menu.innerHTML = `
     <div class="ctxItem" id="renameOpt">✏️ Renombrar</div>
+    <div class="ctxItem" id="exportOpt">⬇️ Exportar</div>
     <div class="ctxItem" id="deleteOpt">🗑 Eliminar</div>
   `;
   document.body.appendChild(menu);
 
+  // --- Opción Exportar (descarga en streaming, sin backups) ---
+  document.getElementById("exportOpt").onclick = () => {
+    menu.remove();
+    window.location.href = `/api/project/${encodeURIComponent(slug)}/export?backups=0`;
+    showToast(`Exportando "${title}"…`, "success");
+  };
+
   // --- Opción Renombrar ---
   document.getElementById("renameOpt").onclick = async () => {
     menu.remove();